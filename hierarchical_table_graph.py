@@ -1,92 +1,495 @@
 #!/usr/bin/env python
+import argparse
 import csv
+import io
+import os
+import re
+import shlex
+import time
 from subprocess import Popen, PIPE
 
-from utils import remove_node
+from utils import db, remove_nodes
 from utils.abstract_graph import AbstractGraph
+from utils.node_store import NodeStore
+from utils.render import new_graph
+from utils.view_arch import validate_views
 
 
-def load_from_docker_psql(database):
+# psql fetches rows through a cursor by batches of this size
+FETCH_COUNT = 10000
+IDENTIFIER_PATTERN = r"^[a-z_][a-z0-9_]*$"
+# Node stores kept between runs for incremental refreshes
+STORE_FOLDER = os.path.expanduser("~/.cache/camptocamp/hierarchy")
+# Odoo sets write_date to the start of the writing transaction: rows written
+# by a transaction still running when the watermark is read (e.g. a
+# migration) get an older write_date, so refreshes look back this long
+WATERMARK_OVERLAP = 6 * 3600
+
+
+def view_to_keep(values):
+    return bool(values["website_id"]) or "website_slx" in values["name"].lower()
+
+
+# Table specific loading options
+TABLE_PRESETS = {
+    "ir_ui_view": {
+        "name_column": "name",
+        "extra_columns": ("key", "website_id"),
+        "keep_predicate": view_to_keep,
+    },
+}
+
+
+def stream_from_docker_psql(database, sql_query, fetch_count=FETCH_COUNT):
+    """ Yields the CSV rows of a query as psql outputs them
+
+    psql reads the result through a server side cursor (FETCH_COUNT) and
+    rows are parsed from its output stream, so the whole result is never
+    held in memory.
+
+    @:parameter database <string>
+    @:parameter sql_query <string>
+    @:returns iterator<list<string>>
+    """
     docker_cmd = "docker-compose run --rm odoo psql"
-    sql_query = "select p.id, p.name, p.key, p.website_id, c.id, c.name, c.key, c.website_id from ir_ui_view as p RIGHT JOIN ir_ui_view as c ON c.inherit_id = p.id"
     proc = Popen([
-        "{} -P pager=off --csv -t -d {} -c '{}'".format(
-            docker_cmd, database, sql_query
+        "{} -P pager=off -v FETCH_COUNT={} --csv -t -d {} -c {}".format(
+            docker_cmd, fetch_count, database, shlex.quote(sql_query)
         )
     ], stdout=PIPE, shell=True)
-    output = proc.stdout.read()
-    modules = {}
-
-    def view_to_keep(name, website_id):
-        return bool(website_id) or "website_slx" in name.lower()
-
-    for line in csv.reader(output.decode("utf-8").splitlines()[8:], delimiter=","):
-        (
-            parent_id,
-            parent_name,
-            parent_key,
-            parent_website_id,
-            child_id,
-            child_name,
-            child_key,
-            child_website_id
-        ) = line
-        # print(line)
-
-        p_name = '/'.join([str(parent_id), parent_key, parent_name])
-        module = modules.get(p_name, {
-            "id": parent_id,
-            "name": parent_name,
-            "key": parent_key,
-            "to_keep": view_to_keep(parent_name, parent_website_id),
-            "website_id": parent_website_id,
-            "children": [],
-        })
-        if child_name not in module["children"]:
-            c_name = '/'.join([str(child_id), child_key, child_name])
-            module["children"].append(c_name)
-            to_keep = view_to_keep(child_name, child_website_id)
-            if to_keep:
-                module["to_keep"] = True
-            sub_module_values = {
-                "id": child_id,
-                "name": child_name,
-                "key": child_key,
-                "to_keep": to_keep,
-                "website_id": child_website_id,
-                "children": [],
-            }
-            sub_module = modules.get(c_name, sub_module_values)
-            modules.update({c_name: sub_module})
-        modules.update({p_name: module})
-    for root_name in modules.keys():
-        module = modules.get(root_name, {"children": []})
-        if module["children"]:
-            module["to_keep"] = _recurse_propagate_to_keep(modules, root_name)
-
-    # print(json.dumps(modules))
+    try:
+        for line in csv.reader(io.TextIOWrapper(proc.stdout, encoding="utf-8")):
+            yield line
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
 
+def select_records_query(dbtable, parent_column, name_column, extra_columns=(), where=""):
+    for identifier in (dbtable, parent_column, name_column) + tuple(extra_columns):
+        if not re.match(IDENTIFIER_PATTERN, identifier):
+            raise Exception("Invalid identifier '{}'".format(identifier))
+    return "select id, {}, {}::text{} from {}{} order by id".format(
+        parent_column,
+        name_column,
+        "".join(", {}".format(c) for c in extra_columns),
+        dbtable,
+        " where {}".format(where) if where else "",
+    )
+
+
+def stream_records(database, sql_query):
+    """ Yields (id, parent id, name, extra values) of queried records """
+    for line in stream_from_docker_psql(database, sql_query):
+        if not line or not line[0].isdigit():
+            # pre lines from output, does not contains any record
+            continue
+        record_id, parent_id, name = line[:3]
+        yield int(record_id), int(parent_id) if parent_id else None, name, line[3:]
+
+
+def load_from_docker_psql(
+        database,
+        dbtable="ir_ui_view",
+        parent_column="inherit_id",
+        name_column="name",
+        extra_columns=(),
+        keep_predicate=None,
+):
+    """ Loads a self referencing table as nodes with their children
+
+    @:parameter database <string>
+    @:parameter dbtable <string> (e.g. ir_ui_view, ir_ui_menu, res_partner)
+    @:parameter parent_column <string> (e.g. inherit_id, parent_id)
+    @:parameter name_column <string> (Column displayed in node names)
+    @:parameter extra_columns list<string> (Other columns to load)
+    @:parameter keep_predicate <callable> (node values -> bool)
+    @:returns <NodeStore>
+    """
+    sql_query = select_records_query(dbtable, parent_column, name_column, extra_columns)
+    modules = NodeStore(extra_columns)
+    for record_id, parent_id, name, extra in stream_records(database, sql_query):
+        modules.add(record_id, parent_id, name, extra)
+    modules.link_children()
+
+    propagate_to_keep(modules, keep_predicate or (lambda values: False))
     return modules
 
 
-def _recurse_propagate_to_keep(modules, name, index=1):
-    module = modules.get(name)
-    # print("|   " * index + name)
-    for child_name in modules.get(name, {"children": []})["children"]:
-        to_keep = _recurse_propagate_to_keep(modules, child_name, index + 1)
-        module["to_keep"] = to_keep or module["to_keep"]
-    # if module["to_keep"]:
-        # print("####" * index)
-    return module["to_keep"]
+def get_watermark(database, dbtable):
+    """ Returns the last write date and the highest id of a table
+
+    @:returns [<string>, <int>]
+    """
+    if not re.match(IDENTIFIER_PATTERN, dbtable):
+        raise Exception("Invalid identifier '{}'".format(dbtable))
+    sql_query = "select coalesce(max(write_date)::text, ''), coalesce(max(id), 0) from {}".format(
+        dbtable
+    )
+    for line in stream_from_docker_psql(database, sql_query):
+        if len(line) == 2 and line[1].isdigit():
+            return [line[0], int(line[1])]
+    raise Exception("Cannot read the watermark of {}".format(dbtable))
+
+
+def refresh_from_docker_psql(
+        database,
+        modules,
+        watermark,
+        dbtable="ir_ui_view",
+        parent_column="inherit_id",
+        name_column="name",
+        extra_columns=(),
+        keep_predicate=None,
+        overlap=WATERMARK_OVERLAP,
+):
+    """ Patches nodes loaded by `load_from_docker_psql` with the records
+    written, created or deleted since `watermark`
+
+    Only recent rows and the list of ids are fetched. As `write_date` is the
+    start of the writing transaction, a row committed after the watermark
+    was read may have an older `write_date`: rows written up to `overlap`
+    seconds before the watermark are fetched again, and the ones equal to
+    the stored record are skipped. Transactions longer than `overlap` can
+    still be missed.
+
+    @:parameter modules <NodeStore> (Patched in place)
+    @:parameter watermark [<string>, <int>] (see `get_watermark`)
+    @:parameter overlap <int> (Seconds)
+    @:returns <dict> (New watermark, changed, deleted and moved records,
+        records whose `to_keep` flag changed)
+    """
+    new_watermark = get_watermark(database, dbtable)
+    write_date, max_id = watermark
+    where = "id > {}".format(int(max_id))
+    if write_date:
+        where += " or write_date > '{}'::timestamp - interval '{} seconds'".format(
+            write_date.replace("'", "''"), int(overlap)
+        )
+    sql_query = select_records_query(
+        dbtable, parent_column, name_column, extra_columns, where=where
+    )
+    dirty = set()
+    changed = []
+    moved = {}
+    for record_id, parent_id, name, extra in stream_records(database, sql_query):
+        existed = record_id in modules
+        if existed:
+            record = modules[record_id]
+            if (record.parent_id, record.name, record.extra) == (parent_id, name, tuple(extra)):
+                # Fetched again because of the overlap
+                continue
+        record, old_parent_id = modules.update(record_id, parent_id, name, extra)
+        changed.append(record_id)
+        dirty.add(record_id)
+        if existed and old_parent_id != parent_id:
+            moved[record_id] = old_parent_id
+            dirty.add(old_parent_id)
+
+    # A record may move under a parent streamed after it: links are only
+    # complete once every row is applied
+    modules.link_children()
+
+    ids = {
+        int(line[0])
+        for line in stream_from_docker_psql(database, "select id from {}".format(dbtable))
+        if line and line[0].isdigit()
+    }
+    deleted = [record_id for record_id in modules if record_id not in ids]
+    for record_id in deleted:
+        record = modules.discard(record_id)
+        dirty.add(record.parent_id)
+    dirty.difference_update(deleted)
+    dirty.discard(None)
+
+    return {
+        "watermark": new_watermark,
+        "changed": changed,
+        "deleted": deleted,
+        "moved": moved,
+        "to_keep": patch_to_keep(
+            modules, dirty, keep_predicate or (lambda values: False)
+        ),
+    }
+
+
+def patch_to_keep(modules, record_ids, keep_predicate):
+    """ Recomputes `to_keep` of changed records, walking up to their
+    ancestors while the flag changes
+
+    @:parameter record_ids iterable<int> (Changed records, or records
+        whose children changed)
+    @:returns set<int> (Records whose flag changed)
+    """
+    flipped = set()
+    for record_id in record_ids:
+        forced = True
+        while record_id in modules:
+            record = modules[record_id]
+            to_keep = bool(keep_predicate(record)) or any(
+                modules[child_id].to_keep for child_id in record.children
+                if child_id in modules
+            )
+            if to_keep == record.to_keep and not forced:
+                break
+            if to_keep != record.to_keep:
+                record.to_keep = to_keep
+                flipped.symmetric_difference_update([record_id])
+            forced = False
+            record_id = record.parent_id
+    return flipped
+
+
+def propagate_to_keep(modules, keep_predicate):
+    """ Marks nodes to keep: matching `keep_predicate` or having a
+    descendant to keep
+
+    Nodes are visited once in reverse topological order (children before
+    parents), without recursion, so shared subtrees are not walked again
+    and deep chains are fine. Nodes in a cycle, if any, are visited last.
+
+    @:parameter modules <NodeStore> (Nodes with their children)
+    @:parameter keep_predicate <callable> (node values -> bool)
+    """
+    parents_count = dict.fromkeys(modules, 0)
+    for values in modules.values():
+        for child_name in values["children"]:
+            parents_count[child_name] += 1
+    order = [name for name, count in parents_count.items() if not count]
+    for name in order:
+        for child_name in modules[name]["children"]:
+            parents_count[child_name] -= 1
+            if not parents_count[child_name]:
+                order.append(child_name)
+    if len(order) < len(modules):
+        ordered = set(order)
+        order.extend(name for name in modules if name not in ordered)
+
+    for name in reversed(order):
+        values = modules[name]
+        values["to_keep"] = bool(keep_predicate(values)) or any(
+            modules[child_name]["to_keep"] for child_name in values["children"]
+        )
+
+
+def load_view_arches(database, record_ids=None):
+    """ Loads view architectures with what is needed to combine them
+
+    Like Odoo, inactive views are not applied, nor any view inheriting from
+    them.
+
+    @:parameter record_ids set<int> (Views to load, all by default)
+    @:returns dict<int, (int, string, int, string)>
+        (id -> inherit id, mode, priority, arch)
+    """
+    sql_query = (
+        "select id, inherit_id, mode, priority, arch_db::text from ir_ui_view"
+        " where active order by id"
+    )
+    views = {}
+    for line in stream_from_docker_psql(database, sql_query):
+        if not line or not line[0].isdigit():
+            continue
+        record_id, parent_id, mode, priority, arch = line[:5]
+        record_id = int(record_id)
+        if record_ids is not None and record_id not in record_ids:
+            continue
+        views[record_id] = (
+            int(parent_id) if parent_id else None,
+            mode,
+            int(priority or 16),
+            arch,
+        )
+    children = {}
+    for record_id, values in views.items():
+        children.setdefault(values[0], []).append(record_id)
+    # Only views reachable from an active root view are applied
+    applied = []
+    stack = list(children.get(None, []))
+    while stack:
+        record_id = stack.pop()
+        applied.append(record_id)
+        stack.extend(children.get(record_id, []))
+    return {record_id: views[record_id] for record_id in sorted(applied)}
+
+
+def leaves_first(modules, record_ids):
+    """ Orders records so that children always come before their parent
+
+    @:parameter modules <NodeStore>
+    @:parameter record_ids iterable<int>
+    @:returns list<int>
+    """
+    to_order = set(record_ids)
+    children_count = {
+        record_id: len(modules[record_id].children & to_order)
+        for record_id in to_order
+    }
+    order = [record_id for record_id, count in children_count.items() if not count]
+    for record_id in order:
+        parent_id = modules[record_id].parent_id
+        if parent_id in children_count:
+            children_count[parent_id] -= 1
+            if not children_count[parent_id]:
+                order.append(parent_id)
+    return order
+
+
+def purge_records(
+        database,
+        dbtable,
+        record_ids,
+        chunk_size=1000,
+        chunks_per_transaction=10,
+        dry_run=False,
+        dsn=None,
+):
+    """ Deletes records by chunks, in the given order
+
+    Each chunk is a single `DELETE ... WHERE id = ANY(...)` and chunks are
+    committed by groups of `chunks_per_transaction`. A pooled connection is
+    used when a server is explicitly configured (`dsn` or PGHOST), else
+    statements are piped to the docker-compose psql records were read from.
+
+    @:parameter record_ids list<int> (Ordered, see `leaves_first`)
+    @:returns <dict> (Deleted rows, chunks, duration and throughput, the
+        latter only when rows were deleted)
+    """
+    if not re.match(IDENTIFIER_PATTERN, dbtable):
+        raise Exception("Invalid identifier '{}'".format(dbtable))
+    chunks = [
+        record_ids[index:index + chunk_size]
+        for index in range(0, len(record_ids), chunk_size)
+    ]
+    query = "DELETE FROM {} WHERE id = ANY(%s)".format(dbtable)
+    start = time.time()
+    deleted = 0
+    if dry_run:
+        deleted = len(record_ids)
+    elif db.direct_connection(dsn):
+        with db.connection(database, dsn) as conn:
+            try:
+                with conn.cursor() as cr:
+                    for index, chunk in enumerate(chunks, 1):
+                        cr.execute(query, (chunk,))
+                        deleted += cr.rowcount
+                        if not index % chunks_per_transaction:
+                            conn.commit()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    else:
+        def statements():
+            for index, chunk in enumerate(chunks):
+                if not index % chunks_per_transaction:
+                    yield "BEGIN;"
+                yield query.replace("%s", "'{{{}}}'::int[]".format(
+                    ",".join(str(record_id) for record_id in chunk)
+                )) + ";"
+                if not (index + 1) % chunks_per_transaction or index + 1 == len(chunks):
+                    yield "COMMIT;"
+
+        returncode, tags = db.run_docker_psql_script(database, statements())
+        if returncode:
+            raise Exception("Purge of {} failed".format(dbtable))
+        deleted = sum(
+            int(tag.split()[1]) for tag in tags
+            if re.match(r"^DELETE [0-9]+$", tag)
+        )
+    duration = time.time() - start
+    stats = {
+        "dry_run": dry_run,
+        "deleted": 0 if dry_run else deleted,
+        "chunks": len(chunks),
+        "seconds": round(duration, 3),
+    }
+    if dry_run:
+        stats["to_delete"] = deleted
+    elif deleted and duration:
+        stats["rows_per_second"] = round(deleted / duration)
+    return stats
 
 
 class HierarchicalTable(AbstractGraph):
 
-    def __init__(self, name, dbtable, parent_column="parent_id"):
-        super().__init__(name, dbtable=dbtable, parent_column=parent_column)
+    _watermark = None
+
+    def __init__(self, name, dbtable, parent_column="parent_id", incremental=False, **kwargs):
+        """
+        @:parameter incremental <bool> (Keep nodes between runs and only
+            fetch records changed since the previous one)
+        """
+        self._dbtable = dbtable
+        self._incremental = incremental
+        options = dict(TABLE_PRESETS.get(dbtable, {}), **kwargs)
+        self._options = dict(options, dbtable=dbtable, parent_column=parent_column)
+        self._options.pop("exclude_nodes", None)
+        super().__init__(name, dbtable=dbtable, parent_column=parent_column, **options)
+
+    def _store_file(self):
+        return os.path.join(STORE_FOLDER, "{}-{}.json".format(self._name, self._dbtable))
+
+    def _store_key(self):
+        """ Loading options a stored node store must have been loaded with """
+        keep_predicate = self._options.get("keep_predicate")
+        return [
+            self._options["parent_column"],
+            self._options.get("name_column", "name"),
+            list(self._options.get("extra_columns", ())),
+            keep_predicate and keep_predicate.__qualname__,
+        ]
 
     def _load_nodes(self, **kwargs):
-        return load_from_docker_psql(self._name)
+        if self._incremental and os.path.isfile(self._store_file()):
+            modules, metadata = NodeStore.load(self._store_file())
+            if metadata.get("key") == self._store_key():
+                self._watermark = metadata["watermark"]
+                self._refresh_nodes(modules)
+                return modules
+        self._watermark = get_watermark(self._name, self._dbtable)
+        modules = load_from_docker_psql(self._name, **kwargs)
+        if self._incremental:
+            modules.save(self._store_file(), key=self._store_key(), watermark=self._watermark)
+        return modules
+
+    def _refresh_nodes(self, modules):
+        changes = refresh_from_docker_psql(
+            self._name, modules, self._watermark, **self._options
+        )
+        self._watermark = changes["watermark"]
+        modules.save(self._store_file(), key=self._store_key(), watermark=self._watermark)
+        return changes
+
+    def refresh(self):
+        """ Fetches records changed since the last load or refresh, then
+        patches nodes, the graph and nodes to keep in place
+
+        @:returns <dict> (see `refresh_from_docker_psql`)
+        """
+        changes = self._refresh_nodes(self._nodes)
+        for record_id in changes["deleted"]:
+            if self._graph.has_node(str(record_id)):
+                self._graph.remove_node(str(record_id))
+        for record_id, old_parent_id in changes["moved"].items():
+            if self._graph.has_edge(str(old_parent_id), str(record_id)):
+                self._graph.remove_edge(str(old_parent_id), str(record_id))
+        for record_id in changes["changed"]:
+            record = self._nodes[record_id]
+            if not self._graph.has_node(str(record_id)):
+                self._graph.add_node(str(record_id), style="filled")
+            if record.parent_id in self._nodes:
+                self._graph.add_edge(str(record.parent_id), str(record_id))
+        for record_id in set(changes["changed"]) | changes["to_keep"]:
+            if self._graph.has_node(str(record_id)):
+                color, fillcolor, group = self._get_cfg_from_node(
+                    record_id, self._nodes[record_id]
+                )
+                node = self._graph.get_node(str(record_id))
+                node.attr["color"] = color or ""
+                node.attr["fillcolor"] = fillcolor or ""
+        self._invalidate()
+        return changes
 
     @staticmethod
     def _get_cfg_from_node(name, values):
@@ -97,40 +500,171 @@ class HierarchicalTable(AbstractGraph):
             fillcolor = "blue"
         return color, fillcolor, None
 
+    def propagate_to_keep(self, keep_predicate):
+        """ Recomputes nodes to keep with another predicate
+
+        @:parameter keep_predicate <callable> (node values -> bool)
+        """
+        propagate_to_keep(self._nodes, keep_predicate)
+        self._options["keep_predicate"] = keep_predicate
+        self._invalidate()
+
+    def ids_to_keep(self):
+        """ Returns the ids of records to keep and of all their ancestors,
+        as inherited records need their whole parent chain
+
+        @:returns list<int> (Sorted, e.g. for `WHERE id = ANY(%s)`)
+        """
+        return sorted(self._nodes.ancestors_closure(
+            record_id for record_id, record in self._nodes.items()
+            if record.to_keep
+        ))
+
     def nodes_to_keep(self):
-        nodes = []
-        for node, values in self._nodes.items():
-            if values["to_keep"]:
-                nodes.append(node)
-                nodes.extend(self._graph.predecessors(node))
-        return set(nodes)
+        """ Returns the graph nodes to keep, see `ids_to_keep`
+
+        @:returns set<string>
+        """
+        return {str(record_id) for record_id in self.ids_to_keep()}
 
     def _generate_pygraphviz(
             self,
             exclude_nodes=None,
             lambda_color_fillcolor_group=lambda name, values: (None, None, None)
     ):
-        return super()._generate_pygraphviz(
-            exclude_nodes=exclude_nodes,
-            lambda_color_fillcolor_group=self._get_cfg_from_node
+        """ Nodes are named by record id, display names are only set when
+        rendering """
+        graph = new_graph()
+        for record_id, record in self._nodes.items():
+            color, fillcolor, group = self._get_cfg_from_node(record_id, record)
+            graph.add_node(
+                str(record_id),
+                style="filled",
+                color=color,
+                fillcolor=fillcolor,
+                group=group,
+            )
+        graph.add_edges_from(
+            (str(record.id), str(child_id))
+            for record in self._nodes.values()
+            for child_id in record.children
+        )
+        return graph
+
+    def save_as(self, filename="nodes_dependency_graph-{}.png", **kwargs):
+        for node in self._graph.iternodes():
+            node.attr["label"] = self._nodes[node].display_name()
+        return super().save_as(filename, **kwargs)
+
+    def purge(self, chunk_size=1000, chunks_per_transaction=10, dry_run=False, dsn=None):
+        """ Deletes every record not to keep from the database, leaves first
+
+        Tables without a keep predicate (see `TABLE_PRESETS` and
+        `propagate_to_keep`) are never purged: nothing would be kept.
+
+        @:returns <dict> (see `purge_records`)
+        """
+        if not self._options.get("keep_predicate"):
+            raise Exception(
+                "No keep predicate for {}, purging would delete every record".format(
+                    self._dbtable
+                )
+            )
+        to_keep = set(self.ids_to_keep())
+        to_remove = leaves_first(
+            self._nodes, [i for i in self._nodes if i not in to_keep]
+        )
+        return purge_records(
+            self._name,
+            self._dbtable,
+            to_remove,
+            chunk_size=chunk_size,
+            chunks_per_transaction=chunks_per_transaction,
+            dry_run=dry_run,
+            dsn=dsn,
+        )
+
+    def validate_arches(self, record_ids=None, max_workers=None):
+        """ Combines inherited views offline and reports specs which do not
+        resolve, each view tree being validated in its own process
+
+        @:parameter record_ids set<int> (e.g. `ids_to_keep()`, all by default)
+        @:returns list<dict> (see `utils.view_arch.validate_tree`)
+        """
+        if self._dbtable != "ir_ui_view":
+            raise Exception("Architectures can only be validated on ir_ui_view")
+        return validate_views(
+            load_view_arches(self._name, record_ids), max_workers=max_workers
         )
 
     def remove_nodes(self, nodes):
         """ Removes a list of nodes """
-        for node in nodes:
-            remove_node(self._graph, node)
+        remove_nodes(self._graph, nodes)
+        self._invalidate()
 
 
 if __name__ == "__main__":
-    graph = HierarchicalTable("odoodb_template", "ir_ui_view", "inherit_id")
-    to_keep = set(graph.nodes_to_keep())
-    ids_to_keep = [values["id"] for node, values in filter(lambda k: k[0] in to_keep, graph._nodes.items())]
+    parser = argparse.ArgumentParser(description='Hierarchical table cleaner')
+    parser.add_argument('--database', '-d', default='odoodb_template')
+    parser.add_argument('--table', default='ir_ui_view')
+    parser.add_argument('--parent-column', default='inherit_id')
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Reuse the nodes stored by the previous run, only fetching '
+             'records changed since'
+    )
+    parser.add_argument(
+        '--purge',
+        action='store_true',
+        help='Delete records not to keep from the database'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Plan the purge without deleting anything'
+    )
+    parser.add_argument(
+        '--dsn',
+        default=None,
+        help='Delete over a direct connection to this server (the one '
+             'docker-compose uses), instead of docker-compose psql'
+    )
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--chunks-per-transaction', type=int, default=10)
+    parser.add_argument(
+        '--validate-arch',
+        action='store_true',
+        help='Report inherited views specs which do not resolve'
+    )
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-render', action='store_true')
+    args = parser.parse_args()
+
+    graph = HierarchicalTable(
+        args.database, args.table, args.parent_column, incremental=args.incremental
+    )
+    ids_to_keep = graph.ids_to_keep()
+    to_keep = {str(record_id) for record_id in ids_to_keep}
     all_nodes = set(graph.nodes())
     to_remove = all_nodes.difference(to_keep)
-    graph.remove_nodes(to_remove)
     print("All nodes {}".format(len(all_nodes)))
     print("Nodes to keep {}".format(len(to_keep)))
     print("Nodes ids to keep {}".format(len(ids_to_keep)))
     print("ids list to keep {}".format(ids_to_keep))
     print("Nodes to remove {}".format(len(all_nodes - to_keep)))
-    graph.save_as()
+    if args.validate_arch:
+        errors = graph.validate_arches(set(ids_to_keep), max_workers=args.workers)
+        for error in errors:
+            print("View {view_id} (root {root_id}): {error}".format(**error))
+        print("Unresolved specs {}".format(len(errors)))
+    if args.purge or args.dry_run:
+        print("Purge {}".format(graph.purge(
+            chunk_size=args.chunk_size,
+            chunks_per_transaction=args.chunks_per_transaction,
+            dry_run=args.dry_run,
+            dsn=args.dsn,
+        )))
+    if not args.no_render:
+        graph.remove_nodes(to_remove)
+        graph.save_as()
@@ -1,53 +1,259 @@
 #!/usr/bin/env python
+import hashlib
 import json
 import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
 
 import click
 
-from odoo_module_graph import OdooModules
+from utils import daemon
 
 _logger = logging.getLogger(__name__)
 
+# One daemon per project, as manifests are looked up from the current folder
+SOCKET_PATH = os.environ.get(
+    "ODOO_MODULES_SOCKET",
+    os.path.join(tempfile.gettempdir(), "odoo_modules-{}.sock".format(
+        hashlib.md5(os.getcwd().encode("utf-8")).hexdigest()[:12]
+    ))
+)
+
+# Seconds during which the daemon trusts its graphs without asking the
+# database whether module states changed
+SIGNATURE_CHECK_INTERVAL = 10
+
+# Commands answered either locally or by a running daemon
+COMMANDS = {
+    "optimize_dependencies": lambda modules, restrict_path=None: (
+        modules.get_optimized_modules_dependencies(restrict_path)
+    ),
+    "module_to_update": lambda modules: modules.get_modules_to_update(),
+    "module_to_remove": lambda modules: modules.get_modules_to_remove(),
+    "installed_modules": lambda modules, no_dependency=False: (
+        modules.get_installed_modules(only_leaves=no_dependency)
+    ),
+    "upgrade_schedule": lambda modules, workers=1, durations=None, logs=(): (
+        modules.get_upgrade_schedule(
+            workers, dict(module_durations(modules, logs), **(durations or {}))
+        )
+    ),
+    "state_counts": lambda modules: modules.get_state_counts(),
+    "simulate_install": lambda modules, install=(), uninstall=(): (
+        modules.simulate_install(install, uninstall)
+    ),
+    "minimize_upgrades": lambda modules, lists=None: {
+        label: modules.get_minimal_upgrade_list(upgrade)
+        for label, upgrade in (lists or {}).items()
+    },
+    "uninstall_plan": lambda modules, uninstall=(), batch_size=10, table_dependencies=None: (
+        modules.get_uninstall_plan(uninstall, batch_size, table_dependencies)
+    ),
+    "impact": lambda modules, files=(): (
+        modules.get_modules_to_update_from_files(files)
+    ),
+    "critical_path": lambda modules, durations=None, logs=(): (
+        modules.get_critical_path(
+            dict(module_durations(modules, logs), **(durations or {}))
+        )
+    ),
+}
+
 
 def formatted_print(obj):
     print(json.dumps(obj, sort_keys=True, indent=4, ensure_ascii=False))
 
 
+def git_changed_files(git_range):
+    """ Returns files changed in a git range, looking into bumped submodules
+
+    Both paths of renamed or copied files are returned. A submodule whose
+    commits are not available locally is returned as is, which means all of
+    its modules changed.
+    """
+    output = subprocess.check_output(
+        ["git", "diff", "--raw", "--no-abbrev", "-z", git_range]
+    ).decode("utf-8")
+    fields = output.split("\0")
+    files = []
+    index = 0
+    while index < len(fields) and fields[index].startswith(":"):
+        old_mode, new_mode, old_sha, new_sha, status = fields[index].lstrip(":").split()[:5]
+        # Renames and copies are followed by the old and the new path
+        path_count = 2 if status[0] in "RC" else 1
+        paths = fields[index + 1:index + 1 + path_count]
+        index += 1 + path_count
+        if "160000" not in (old_mode, new_mode):
+            files.extend(paths)
+            continue
+        path = paths[-1]
+        try:
+            sub_output = subprocess.check_output(
+                ["git", "-C", path, "diff", "--name-only", old_sha, new_sha],
+                stderr=subprocess.DEVNULL,
+            ).decode("utf-8")
+        except subprocess.CalledProcessError:
+            files.append(path)
+            continue
+        files.extend(os.path.join(path, f) for f in sub_output.splitlines())
+    return files
+
+
+def module_durations(modules, logs):
+    """ Returns mean durations per module measured in migration logs """
+    from utils.durations import load_module_durations
+    if not logs:
+        return {}
+    return load_module_durations(logs, set(modules.modules()))
+
+
+def load_modules(database):
+    # Imported lazily so daemon clients do not pay for graph libraries
+    from odoo_module_graph import OdooModules
+    return OdooModules(database)
+
+
+def run_command(ctx, command, **params):
+    """ Run a query command through the daemon if one is running, else locally
+    """
+    database = ctx.obj['database']
+    if ctx.obj.get('use_daemon', True):
+        response = daemon.query(SOCKET_PATH, {
+            "command": command,
+            "database": database,
+            "params": params,
+        })
+        if response is not None:
+            if "error" in response:
+                raise click.ClickException(response["error"])
+            return response["result"]
+    return COMMANDS[command](load_modules(database), **params)
+
+
+class ResidentModules:
+    """ Keeps `OdooModules` graphs in memory, one per database
+
+    A graph is reloaded when manifest files changed on disk, when module
+    states changed in the database (see `database_signature`) or when it is
+    older than `ttl` seconds. Signatures cost a psql call, so they are only
+    checked once per `check_interval` seconds: in between, and until a
+    `refresh`, queries are answered from memory.
+    """
+
+    def __init__(self, ttl=300, check_interval=SIGNATURE_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._graphs = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _database_lock(self, database):
+        with self._lock:
+            return self._locks.setdefault(database, threading.Lock())
+
+    def get(self, database):
+        from odoo_module_graph import database_signature, manifests_signature
+        with self._database_lock(database):
+            modules, loaded_signature, loaded_at, checked_at = self._graphs.get(
+                database, (None, None, 0, 0)
+            )
+            now = time.time()
+            if modules is not None and now - loaded_at <= self.ttl:
+                if now - checked_at < self.check_interval:
+                    return modules
+                signature = (manifests_signature(), database_signature(database))
+                if signature == loaded_signature:
+                    self._graphs[database] = (modules, signature, loaded_at, now)
+                    return modules
+            else:
+                signature = (manifests_signature(), database_signature(database))
+            _logger.info("Loading modules graph of %s", database)
+            modules = load_modules(database)
+            now = time.time()
+            self._graphs[database] = (modules, signature, now, now)
+            return modules
+
+    def refresh(self, database=None):
+        with self._lock:
+            for name in [database] if database else list(self._graphs):
+                self._graphs.pop(name, None)
+        return True
+
+    def handle(self, request):
+        command = request.get("command")
+        if command == "ping":
+            return "pong"
+        if command == "refresh":
+            return self.refresh(request.get("database"))
+        if command not in COMMANDS:
+            raise Exception("Unknown command '{}'".format(command))
+        modules = self.get(request["database"])
+        return COMMANDS[command](modules, **request.get("params", {}))
+
+
 @click.group()
 @click.option('--database', "-d", help='Database name')
+@click.option('--no-daemon', is_flag=True, help='Never query a running daemon')
 @click.pass_context
-def cli(ctx, database):
+def cli(ctx, database, no_daemon=False):
     # ensure that ctx.obj exists and is a dict (in case `cli()` is called
     # by means other than the `if` block below)
     ctx.ensure_object(dict)
     ctx.obj['database'] = database
+    ctx.obj['use_daemon'] = not no_daemon
+
+
+@cli.command(name='serve')
+@click.option('--ttl', default=300, help='Seconds before reloading a database graph')
+@click.option(
+    '--check-interval', default=SIGNATURE_CHECK_INTERVAL,
+    help='Seconds between checks of module changes in the database',
+)
+@click.pass_context
+def serve(ctx, ttl=300, check_interval=SIGNATURE_CHECK_INTERVAL):
+    """ Keeps modules graphs resident and answers queries on a Unix socket """
+    resident = ResidentModules(ttl=ttl, check_interval=check_interval)
+    database = ctx.obj['database']
+    if database:
+        resident.get(database)
+    print("Listening on {}".format(SOCKET_PATH))
+    daemon.serve(SOCKET_PATH, resident.handle)
+
+
+@cli.command(name='refresh')
+@click.pass_context
+def refresh(ctx):
+    """ Asks a running daemon to reload its graphs """
+    response = daemon.query(SOCKET_PATH, {
+        "command": "refresh",
+        "database": ctx.obj['database'],
+    })
+    if response is None:
+        raise click.ClickException("No daemon listening on {}".format(SOCKET_PATH))
 
 
 @cli.command(name='optimize_dependencies')
 @click.option('--restrict-path', help='A specific path to search modules from')
 @click.pass_context
 def optimize_dependencies(ctx, restrict_path=None):
-    database = ctx.obj['database']
-    odoo_modules = OdooModules(database)
-    modules = odoo_modules.get_optimized_modules_dependencies(restrict_path)
+    modules = run_command(ctx, 'optimize_dependencies', restrict_path=restrict_path)
     formatted_print(modules)
 
 
 @cli.command(name='module_to_update')
 @click.pass_context
 def module_to_update(ctx):
-    database = ctx.obj['database']
-    odoo_modules = OdooModules(database)
-    modules = odoo_modules.get_modules_to_update()
+    modules = run_command(ctx, 'module_to_update')
     formatted_print(modules)
 
 
 @cli.command(name='module_to_remove')
 @click.pass_context
 def module_to_remove(ctx):
-    database = ctx.obj['database']
-    odoo_modules = OdooModules(database)
-    modules = odoo_modules.get_modules_to_remove()
+    modules = run_command(ctx, 'module_to_remove')
     formatted_print(modules)
 
 
@@ -55,22 +261,162 @@ def module_to_remove(ctx):
 @click.option('--no-dependency', '-N', is_flag=True, help='Includes only modules without dependencies')
 @click.pass_context
 def installed_modules(ctx, no_dependency=False):
-    database = ctx.obj['database']
-    odoo_modules = OdooModules(database)
-    modules = odoo_modules.get_installed_modules(only_leaves=no_dependency)
+    modules = run_command(ctx, 'installed_modules', no_dependency=no_dependency)
     formatted_print(modules)
 
 
+@cli.command(name='state_counts')
+@click.pass_context
+def state_counts(ctx):
+    counts = run_command(ctx, 'state_counts')
+    formatted_print(counts)
+
+
+@cli.command(name='simulate_install')
+@click.option('--install', '-i', multiple=True, help='Module to install')
+@click.option('--uninstall', '-x', multiple=True, help='Module to uninstall')
+@click.pass_context
+def simulate_install(ctx, install=(), uninstall=()):
+    """ Simulates installations including auto_install modules """
+    result = run_command(
+        ctx, 'simulate_install', install=list(install), uninstall=list(uninstall)
+    )
+    formatted_print(result)
+
+
+@cli.command(name='minimize_upgrades')
+@click.option('--migration-file', '-f', default='odoo/migration.yml', type=click.Path(exists=True))
+@click.option('--write', is_flag=True, help='Write the reduced lists back to the migration file')
+@click.pass_context
+def minimize_upgrades(ctx, migration_file, write=False):
+    """ Reports the minimal equivalent upgrade list of each version """
+    from utils.migration_files import (
+        iter_upgrade_lists, load_migration_file, save_migration_file
+    )
+    yaml, data = load_migration_file(migration_file)
+    upgrade_lists = dict(iter_upgrade_lists(data))
+    results = run_command(ctx, 'minimize_upgrades', lists={
+        label: list(upgrade) for label, upgrade in upgrade_lists.items()
+    })
+    if write:
+        for label, upgrade in upgrade_lists.items():
+            minimal = results[label]["minimal"]
+            # Remove in place to keep comments of the remaining entries
+            for index in reversed(range(len(upgrade))):
+                if upgrade[index] not in minimal or upgrade.index(upgrade[index]) != index:
+                    del upgrade[index]
+        save_migration_file(yaml, data, migration_file)
+    formatted_print(results)
+
+
+@cli.command(name='uninstall_plan')
+@click.option('--uninstaller-file', '-f', default='./odoo/songs/migration/uninstall.py', type=click.Path(exists=True))
+@click.option('--errors', type=click.File('r'), help='JSON output of parse_migration_log (drop_table_dependencies)')
+@click.option('--batch-size', '-b', default=10, help='Maximum modules uninstalled at once')
+@click.pass_context
+def uninstall_plan(ctx, uninstaller_file, errors=None, batch_size=10):
+    """ Orders UNINSTALL_MODULES_LIST in dependents first batches """
+    from utils.migration_files import parse_uninstall_list
+    table_dependencies = json.load(errors).get('drop_table_dependencies', {}) if errors else {}
+    plan = run_command(
+        ctx, 'uninstall_plan',
+        uninstall=parse_uninstall_list(uninstaller_file),
+        batch_size=batch_size,
+        table_dependencies=table_dependencies,
+    )
+    formatted_print(plan)
+
+
+@cli.command(name='upgrade_schedule')
+@click.option('--workers', '-w', default=1, help='Number of parallel Odoo workers')
+@click.option('--durations', type=click.File('r'), help='JSON file of module durations in seconds')
+@click.option('--log', '-l', 'logs', multiple=True, type=click.Path(exists=True), help='Past migration log to measure durations from')
+@click.pass_context
+def upgrade_schedule(ctx, workers=1, durations=None, logs=()):
+    """ Plans upgrades/installations in waves for parallel workers """
+    durations = json.load(durations) if durations else {}
+    schedule = run_command(
+        ctx, 'upgrade_schedule',
+        workers=workers,
+        durations=durations,
+        logs=[os.path.abspath(log) for log in logs],
+    )
+    formatted_print(schedule)
+
+
+@cli.command(name='impact')
+@click.argument('files', nargs=-1)
+@click.option('--git-range', '-r', help='Git range to read changed files from (e.g. origin/master..HEAD)')
+@click.pass_context
+def impact(ctx, files, git_range=None):
+    """ Returns the minimal modules to update for changed files """
+    files = list(files)
+    if git_range:
+        files.extend(git_changed_files(git_range))
+    modules = run_command(ctx, 'impact', files=files)
+    formatted_print(modules)
+
+
+@cli.command(name='critical_path')
+@click.option('--durations', type=click.File('r'), help='JSON file of module durations in seconds')
+@click.option('--log', '-l', 'logs', multiple=True, type=click.Path(exists=True), help='Past migration log to measure durations from')
+@click.pass_context
+def critical_path(ctx, durations=None, logs=()):
+    """ Predicts the upgrade time and lists the modules on its critical path """
+    durations = json.load(durations) if durations else {}
+    path = run_command(
+        ctx, 'critical_path',
+        durations=durations,
+        logs=[os.path.abspath(log) for log in logs],
+    )
+    formatted_print(path)
+
+
+@cli.command(name='render')
+@click.option('--output', '-o', default='modules_dependency_graph-{}.png', help='Output file, {} is replaced by the database name')
+@click.option('--collapse-by', help='Draw one node per repository or per module attribute (license, category...)')
+@click.option('--focus', help='Only draw the neighborhood of this module')
+@click.option('--hops', default=1, help='Neighborhood size around --focus')
+@click.option('--prog', help='Graphviz layout program (default: dot, sfdp for big graphs)')
+@click.pass_context
+def render(ctx, output, collapse_by=None, focus=None, hops=1, prog=None):
+    """ Draws the modules dependency graph """
+    load_modules(ctx.obj['database']).save_as(
+        output, collapse_by=collapse_by, focus=focus, hops=hops, prog=prog
+    )
+
+
+@cli.command(name='export')
+@click.option('--output', '-o', default='modules_dependency_graph-{}.graphml', help='.graphml, .ndjson or .csv file (optionally .gz), {} is replaced by the database name')
+@click.pass_context
+def export(ctx, output):
+    """ Streams the modules dependency graph without layout """
+    load_modules(ctx.obj['database']).export(output)
+
+
 @cli.command(name='diff')
 @click.option('--to-database', '-t')
 @click.pass_context
 def diff(ctx, to_database):
     database = ctx.obj['database']
-    from_modules = OdooModules(database)
-    to_modules = OdooModules(to_database)
+    from_modules = load_modules(database)
+    to_modules = load_modules(to_database)
     diff_modules = from_modules.difference(to_modules)
     formatted_print(diff_modules)
 
 
+@cli.command(name='diff-matrix')
+@click.argument('databases', nargs=-1, required=True)
+@click.option('--workers', '-w', type=int, help='Maximum number of concurrent loads')
+@click.pass_context
+def diff_matrix(ctx, databases, workers=None):
+    """ Compares N databases, loaded concurrently, in the given order """
+    from odoo_module_graph import difference_matrix, load_databases
+    databases = list(databases)
+    if ctx.obj['database'] and ctx.obj['database'] not in databases:
+        databases.insert(0, ctx.obj['database'])
+    formatted_print(difference_matrix(load_databases(databases, max_workers=workers)))
+
+
 if __name__ == '__main__':
     cli(obj={})
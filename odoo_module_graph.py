@@ -1,6 +1,12 @@
 import ast
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from itertools import compress
 import re
 import os
+import sys
 from os.path import join as opj
 from subprocess import Popen, PIPE
 
@@ -10,7 +16,8 @@ import networkx as nx
 import pygraphviz
 
 from utils.abstract_graph import AbstractGraph
-from utils import add_node, clean_graph, remove_node, to_native, leaves, check_node
+from utils.memoize import memoized_query
+from utils import add_node, balance, clean_graph, remove_nodes, to_native, leaves, check_node
 
 MANIFEST_FILES = ["__manifest__.py", "__openerp__.py"]
 ADDONS_PATHES = [
@@ -52,6 +59,42 @@ def module_manifest(path):
     return None
 
 
+def manifests_signature(addons_paths=None):
+    """ Returns a fingerprint of the manifest files found in addons paths
+
+    Only file names and modification times are read, which is enough to
+    detect code changes without parsing any manifest.
+
+    @:parameter addons_paths list<string>
+    @:returns <string>
+    """
+    signature = hashlib.sha1()
+    for name, path in sorted(get_modules_pathes(addons_paths, depth=2).items()):
+        manifest_file = module_manifest(path)
+        if not manifest_file:
+            continue
+        signature.update("{}:{}\n".format(
+            manifest_file, os.stat(manifest_file).st_mtime_ns
+        ).encode("utf-8"))
+    return signature.hexdigest()
+
+
+def get_git_submodules(gitmodules=".gitmodules"):
+    """ Returns the paths of git submodules declared in `.gitmodules`
+
+    @:returns list<string>
+    """
+    if not os.path.isfile(gitmodules):
+        return []
+    submodules = []
+    with open(gitmodules, "r") as f:
+        for line in f:
+            match = re.match(r"\s*path\s*=\s*(.+?)\s*$", line)
+            if match:
+                submodules.append(os.path.normpath(match.group(1)))
+    return submodules
+
+
 def load_from_docker_psql(database="odoodb"):
     docker_cmd = "docker-compose run --rm odoo psql"
     sql_query = "select p.name, p.state, p.license, p.application, c.name, c.state, c.license, c.application from ir_module_module as p JOIN ir_module_module_dependency as r ON r.name = p.name JOIN ir_module_module as c ON c.id = r.module_id"
@@ -100,15 +143,53 @@ def load_from_docker_psql(database="odoodb"):
     return modules
 
 
-def update_from_manifest(
-        modules={},
-        addons_paths=None
-):
-    # Load everything now
-    # First all the manifest files per local modules
+# Changes whenever a module is installed, upgraded, removed or its
+# dependencies are updated
+DATABASE_SIGNATURE_QUERY = (
+    "select (select count(*) || '|' || coalesce(max(write_date)::text, '')"
+    " from ir_module_module) || '|' || (select count(*) from ir_module_module_dependency)"
+)
+
+
+def database_signature(database="odoodb"):
+    """ Returns a cheap fingerprint of the module states of a database
+
+    @:parameter database <string>
+    @:returns <string>
+    """
+    from utils import db
+
+    if db.direct_connection():
+        with db.connection(database) as conn:
+            with conn.cursor() as cr:
+                cr.execute(DATABASE_SIGNATURE_QUERY)
+                signature = cr.fetchone()[0]
+            conn.rollback()
+            return signature
+    proc = Popen([
+        "docker-compose run --rm odoo psql -P pager=off -At -d {} -c \"{}\"".format(
+            database, DATABASE_SIGNATURE_QUERY
+        )
+    ], stdout=PIPE, shell=True)
+    output = proc.communicate()[0].decode("utf-8").strip()
+    if proc.returncode or not output:
+        raise Exception("Cannot read the module states of {}".format(database))
+    return output.splitlines()[-1]
+
+
+def load_manifests(addons_paths=None):
+    """ Parse every manifest file found in addons paths
+
+    The result only depends on the code, so it can be shared between
+    several databases loaded from the same project.
+
+    @:parameter addons_paths list<string>
+    @:returns dict<string, (dict, string)> (module name -> (info, manifest file))
+    """
     if addons_paths is None:
         addons_paths = ADDONS_PATHES
 
+    manifests = {}
     for child_name, path in get_modules_pathes(addons_paths, depth=2).items():
         manifest_file = module_manifest(path)
         # default values for descriptor
@@ -149,6 +230,21 @@ def update_from_manifest(
                     # "active" has been renamed "auto_install"
                     info["auto_install"] = info["active"]
 
+        manifests[child_name] = (info, manifest_file)
+    return manifests
+
+
+def update_from_manifest(
+        modules={},
+        addons_paths=None,
+        manifests=None,
+):
+    # Load everything now
+    # First all the manifest files per local modules
+    if manifests is None:
+        manifests = load_manifests(addons_paths)
+
+    for child_name, (info, manifest_file) in manifests.items():
         state = States.UNINSTALLABLE
         if info["installable"] or info["auto_install"]:
             state = States.INSTALLABLE
@@ -164,6 +260,7 @@ def update_from_manifest(
             "application": info["application"],
             "category": info["category"],
             "submodule": os.path.dirname(manifest_file),
+            "auto_install": info["auto_install"],
         })
 
         modules.update({child_name: child_module})
@@ -231,6 +328,251 @@ class States:
             return States.TO_REMOVE
         return result
 
+    # Small integer codes used by `ModuleTable` columns, 0 means no state
+    codes = (
+        False,
+        TO_INSTALL,
+        TO_UPGRADE,
+        TO_REMOVE,
+        INSTALLABLE,
+        INSTALLED,
+        UNINSTALLABLE,
+        UNINSTALLED,
+    )
+    state2code = {state: code for code, state in enumerate(codes)}
+
+    @staticmethod
+    def code(state):
+        """ Returns the integer code of a state (0 for no state) """
+        if not state:
+            return 0
+        return States.state2code[state]
+
+    @staticmethod
+    def merge_table():
+        """ Returns the translation table of merged states
+
+        The byte at `database code << 4 | manifest code` is the code of the
+        merged state, so merging a whole column is a `bytes.translate` call.
+
+        @:returns <bytes>
+        """
+        table = bytearray(256)
+        for database_code, database_state in enumerate(States.codes):
+            for manifest_code, manifest_state in enumerate(States.codes):
+                table[database_code << 4 | manifest_code] = States.code(
+                    States.merge(database_state, manifest_state)
+                )
+        return bytes(table)
+
+
+class ModuleRow(Mapping):
+    """ Read/write view on one module of a `ModuleTable`, behaving like the
+    dict each module used to be stored in """
+
+    __slots__ = ("_table", "_id")
+
+    def __init__(self, table, module_id):
+        self._table = table
+        self._id = module_id
+
+    def __getitem__(self, key):
+        return self._table.get_value(self._id, key)
+
+    def __setitem__(self, key, value):
+        self._table.set_value(self._id, key, value)
+
+    def __iter__(self):
+        return iter(ModuleTable.COLUMNS)
+
+    def __len__(self):
+        return len(ModuleTable.COLUMNS)
+
+    def get(self, key, default=None):
+        try:
+            value = self._table.get_value(self._id, key)
+        except KeyError:
+            return default
+        return default if value is None else value
+
+
+class ModuleTable(Mapping):
+    """ Column-wise storage of modules attributes
+
+    Names are interned and mapped to integer ids, states are stored as
+    `States` codes in byte arrays and children as CSR adjacency (offsets
+    plus targets arrays). Rows are exposed as `ModuleRow` views, so the
+    table can be used as the former dict of dicts.
+    """
+
+    COLUMNS = (
+        "database_state",
+        "manifest_state",
+        "state",
+        "license",
+        "application",
+        "category",
+        "submodule",
+        "auto_install",
+        "children",
+    )
+    STATE_COLUMNS = ("database_state", "manifest_state", "state")
+    _merge_table = States.merge_table()
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.database_state = bytearray()
+        self.manifest_state = bytearray()
+        self.state = bytearray()
+        self.license = []
+        self.application = bytearray()
+        self.category = []
+        self.submodule = []
+        # False, True or the tuple of dependencies triggering installation
+        self.auto_install = []
+        self.children_offsets = array("L", [0])
+        self.children_targets = array("L")
+        self._parents = None
+
+    @classmethod
+    def from_dict(cls, modules):
+        """ Builds a table from modules as loaded from database and manifests
+
+        @:parameter modules dict<string, dict>
+        @:returns <ModuleTable>
+        """
+        table = cls()
+        names = list(modules)
+        for children_names in [v.get("children", []) for v in modules.values()]:
+            names.extend(c for c in children_names if c not in modules)
+        for name in names:
+            if name in table.ids:
+                continue
+            values = modules.get(name, {})
+            table.ids[sys.intern(name)] = len(table.names)
+            table.names.append(sys.intern(name))
+            table.database_state.append(States.code(values.get("database_state")))
+            table.manifest_state.append(States.code(values.get("manifest_state")))
+            table.state.append(States.code(values.get("state")))
+            table.license.append(values.get("license") and sys.intern(values["license"]))
+            table.application.append(bool(values.get("application")))
+            table.category.append(values.get("category") and sys.intern(values["category"]))
+            table.submodule.append(values.get("submodule"))
+            auto_install = values.get("auto_install", False)
+            if isinstance(auto_install, (list, tuple)):
+                auto_install = tuple(sys.intern(d) for d in auto_install)
+            table.auto_install.append(auto_install)
+        for name in table.names:
+            children = set(modules.get(name, {}).get("children", []))
+            table.children_targets.extend(sorted(table.ids[c] for c in children))
+            table.children_offsets.append(len(table.children_targets))
+        return table
+
+    def merge_states(self):
+        """ Computes the resulting state of every module at once
+
+        Database codes are shifted into the high nibble of each byte (codes
+        are lower than 16 so no bit spills over) and combined with manifest
+        codes, then the merge table translates all pairs in one call.
+        """
+        size = len(self.names)
+        pairs = (
+            int.from_bytes(self.database_state, "big") << 4
+            | int.from_bytes(self.manifest_state, "big")
+        ).to_bytes(size, "big")
+        self.state = bytearray(pairs.translate(self._merge_table))
+
+    def filter(self, states, invert=False):
+        """ Returns module names whose state is in `states`
+
+        @:parameter states list<string>
+        @:parameter invert <bool> (Returns modules whose state is not in `states`)
+        @:returns list<string>
+        """
+        codes = {States.code(s) for s in states}
+        mask = bytes((code in codes) != invert for code in range(256))
+        return list(compress(self.names, self.state.translate(mask)))
+
+    def counts(self):
+        """ Returns the number of modules per state
+
+        @:returns dict<string, int>
+        """
+        counts = {}
+        for code, state in enumerate(States.codes):
+            count = self.state.count(code)
+            if code and count:
+                counts[state] = count
+        return counts
+
+    def children(self, name):
+        module_id = self.ids[name]
+        return [
+            self.names[i] for i in self.children_targets[
+                self.children_offsets[module_id]:self.children_offsets[module_id + 1]
+            ]
+        ]
+
+    def parents(self, name):
+        if self._parents is None:
+            parents = [[] for _ in self.names]
+            for module_id in range(len(self.names)):
+                for child_id in self.children_targets[
+                    self.children_offsets[module_id]:self.children_offsets[module_id + 1]
+                ]:
+                    parents[child_id].append(module_id)
+            self._parents = parents
+        return [self.names[i] for i in self._parents[self.ids[name]]]
+
+    def get_state(self, name):
+        return States.codes[self.state[self.ids[name]]]
+
+    def get_value(self, module_id, key):
+        if key in self.STATE_COLUMNS:
+            return States.codes[getattr(self, key)[module_id]]
+        if key == "application":
+            return bool(self.application[module_id])
+        if key == "children":
+            return self.children(self.names[module_id])
+        if key in self.COLUMNS:
+            return getattr(self, key)[module_id]
+        raise KeyError(key)
+
+    def set_value(self, module_id, key, value):
+        if key in self.STATE_COLUMNS:
+            getattr(self, key)[module_id] = States.code(value)
+        elif key == "application":
+            self.application[module_id] = bool(value)
+        elif key in ("license", "category", "submodule", "auto_install"):
+            getattr(self, key)[module_id] = value
+        else:
+            raise KeyError(key)
+
+    def __getitem__(self, name):
+        return ModuleRow(self, self.ids[name])
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __eq__(self, other):
+        if not isinstance(other, ModuleTable):
+            return NotImplemented
+        return all(
+            getattr(self, column) == getattr(other, column)
+            for column in (
+                "names", "database_state", "manifest_state", "state",
+                "license", "application", "category", "submodule",
+                "auto_install", "children_offsets", "children_targets",
+            )
+        )
+
 
 class OdooModules(AbstractGraph):
     """ https://pythonhosted.org/OERPLib/tutorials.html#inspect-the-metadata-of-your-server-new-in-version-0-8
@@ -239,13 +581,15 @@ class OdooModules(AbstractGraph):
 
     _exclude_states = set()
     _exclude_test_module = True
+    _addons_index = None
 
     def __init__(
             self,
             database,
             exclude_nodes=(),
             exclude_states=(),
-            include_test_module=False
+            include_test_module=False,
+            manifests=None,
     ):
         assert (
             all([s for s in exclude_states if s in States.state2color.keys()]))
@@ -253,12 +597,12 @@ class OdooModules(AbstractGraph):
 
         # Then priority to load the database
         # Then process manifest files (contains real code values to be applied)
-        self._nodes = load_from_docker_psql(self._name)
-        update_from_manifest(self._nodes)
+        modules = load_from_docker_psql(self._name)
+        update_from_manifest(modules, manifests=manifests)
+        self._nodes = ModuleTable.from_dict(modules)
 
         # Process resulting states and inconsistency
-        for module_name in self._nodes.keys():
-            self._nodes[module_name]["state"] = self.get_state(module_name)
+        self._nodes.merge_states()
 
         # with open("modules.json", "w") as a_file:
         #     json.dump(dict(sorted(self._nodes.items())), a_file)
@@ -355,19 +699,20 @@ class OdooModules(AbstractGraph):
 
         for name, values in self._nodes.items():
             # Populate the graph entirely (we need all original edges and nodes)
-            state = self.get_state(name)
+            state = self._nodes.get_state(name)
             color = States.state2color[state][1]
             fillcolor = States.state2color[state][0]
             group = States.state2group[state]
             add_node(graph, name, values, color, fillcolor, group)
 
-        for name in graph.nodes():
+        remove_nodes(graph, [
+            name for name in graph.nodes()
             if (
-                    name in exclude_modules
-                    or self.get_state(name) in exclude_states
-                    or (not include_test_module and name.startswith("test_"))
-            ):
-                remove_node(graph, name)
+                name in exclude_modules
+                or self._nodes.get_state(name) in exclude_states
+                or (not include_test_module and name.startswith("test_"))
+            )
+        ])
         clean_graph(graph)
         # for name in graph.nodes():
         #     self._check_state_from_predecessors(graph, name)
@@ -400,6 +745,34 @@ class OdooModules(AbstractGraph):
         clean_graph(graph)
         return graph
 
+    def _get_addons_index(self):
+        """ Returns module directories and git submodules mapped to modules
+
+        @:returns (dict<string, string>, dict<string, list<string>>)
+        """
+        if self._addons_index is None:
+            paths = {
+                os.path.normpath(values["submodule"]): name
+                for name, values in self._nodes.items()
+                if values.get("submodule")
+            }
+            submodules = {}
+            for submodule in get_git_submodules():
+                prefix = submodule + os.sep
+                submodules[submodule] = sorted(
+                    name for path, name in paths.items()
+                    if path.startswith(prefix)
+                )
+            self._addons_index = (paths, submodules)
+        return self._addons_index
+
+    def _cluster_of(self, name, collapse_by):
+        if collapse_by == "repository":
+            values = self._nodes.get(name)
+            submodule = values and values.get("submodule")
+            return os.path.dirname(os.path.normpath(submodule)) if submodule else None
+        return super()._cluster_of(name, collapse_by)
+
     def _sub_graph_from_states(self, graph, states=None):
         """ Returns a subgraph for all module for state in `states`
 
@@ -408,13 +781,9 @@ class OdooModules(AbstractGraph):
         """
         if states is None:
             states = []
-        modules_to_remove = [
-            name for name in self._nodes.keys()
-            if self.get_state(name) not in states
-        ]
+        modules_to_remove = self._nodes.filter(states, invert=True)
         sub_graph = graph.copy()
-        for name in modules_to_remove:
-            remove_node(sub_graph, name)
+        remove_nodes(sub_graph, modules_to_remove)
         clean_graph(sub_graph)
         return sub_graph
 
@@ -423,7 +792,7 @@ class OdooModules(AbstractGraph):
     #
 
     def __hash__(self):
-        return self._nodes.__hash__()
+        return super().__hash__()
 
     def __eq__(self, other):
         if isinstance(other, OdooModules):
@@ -441,20 +810,7 @@ class OdooModules(AbstractGraph):
     # DO NOT USE IN PRIVATE METHODS
     #
 
-    def get_state(self, name):
-        """ Returns the final state of a module depending of it"s state in
-        database and manifest """
-        if name not in self._nodes.keys():
-            return None
-        database_state = self._nodes[name].get("database_state", False)
-        manifest_state = self._nodes[name].get("manifest_state", False)
-        result = States.merge(database_state, manifest_state)
-        if not result:
-            raise Exception("Inconsistent states db:{} manifest:{}".format(
-                database_state, manifest_state
-            ))
-        return result
-
+    @memoized_query
     def get_dependencies(self, name):
         """ Returns the dependency list of a module
 
@@ -474,7 +830,7 @@ class OdooModules(AbstractGraph):
         @:raise ModuleNotFoundError
         """
         check_node(self._graph, name)
-        return self._nodes[name]["state"]
+        return self._nodes.get_state(name)
 
     def modules(self):
         """ Return full modules list
@@ -483,6 +839,7 @@ class OdooModules(AbstractGraph):
         """
         return self._graph.nodes()
 
+    @memoized_query
     def leaves(self):
         """ Return modules not in dependency of any other module
 
@@ -491,6 +848,7 @@ class OdooModules(AbstractGraph):
         modules = leaves(self._graph)
         return modules
 
+    @memoized_query
     def get_optimized_modules_dependencies(self, path=None):
         """ Returns the diff between actual dependencies and optimized ones
 
@@ -519,15 +877,13 @@ class OdooModules(AbstractGraph):
                     common_path = relpath in relsubpath
                 if not common_path:
                     continue
-            children = [
-                m for m, v in module_items
-                if module in v["children"]
-            ]
+            children = self._nodes.parents(module)
             predecessors = graph.predecessors(module)
             if set(predecessors) != set(children):
                 diff[module] = sorted(predecessors)
         return dict(sorted(diff.items()))
 
+    @memoized_query
     def get_modules_to_update(self):
         """ Returns the shortest list of modules to update"""
         states = [States.TO_UPGRADE]
@@ -536,6 +892,7 @@ class OdooModules(AbstractGraph):
         lcas = self._lowest_common_ancestors(graph, modules, states=states)
         return sorted(lcas)
 
+    @memoized_query
     def get_modules_to_install(self):
         """ Returns the shortest list of modules to install"""
         states = [States.TO_INSTALL]
@@ -543,6 +900,7 @@ class OdooModules(AbstractGraph):
         modules = leaves(graph)
         return sorted(modules)
 
+    @memoized_query
     def get_modules_to_remove(self):
         """ Returns the shortest list of modules to remove"""
         states = [States.TO_REMOVE]
@@ -551,62 +909,460 @@ class OdooModules(AbstractGraph):
         lcas = self._lowest_common_ancestors(graph, modules, states=states)
         return sorted(lcas)
 
+    def get_upgrade_schedule(self, workers=1, durations=None, default_duration=1.0):
+        """ Plans the upgrade and installation of modules in parallel waves
+
+        Modules to upgrade or install are split into topological waves: a
+        wave only depends on previous ones, so its modules can be processed
+        by `workers` Odoo instances at the same time. Modules are balanced
+        between workers by their historical duration. Independent components
+        are listed too as they may run on separate databases.
+
+        @:parameter workers <int> (Number of parallel workers)
+        @:parameter durations dict<string, float> (module -> seconds)
+        @:parameter default_duration <float> (Used for unknown modules)
+        @:returns <dict>
+        """
+        if durations is None:
+            durations = {}
+        graph = self._sub_graph_from_states(self._graph, [
+            States.TO_UPGRADE,
+            States.TO_INSTALL,
+        ])
+        nx_digraph = nx.DiGraph(graph)
+        waves = []
+        makespan = 0.0
+        for generation in nx.topological_generations(nx_digraph):
+            weights = {
+                module: float(durations.get(module, default_duration))
+                for module in generation
+            }
+            wave_workers = []
+            for load, modules in balance(weights, workers):
+                wave_workers.append({
+                    "duration": load,
+                    "install": [
+                        m for m in modules
+                        if self._nodes.get_state(m) == States.TO_INSTALL
+                    ],
+                    "upgrade": [
+                        m for m in modules
+                        if self._nodes.get_state(m) == States.TO_UPGRADE
+                    ],
+                })
+            wave_duration = max(w["duration"] for w in wave_workers)
+            makespan += wave_duration
+            waves.append({"duration": wave_duration, "workers": wave_workers})
+        return {
+            "workers": workers,
+            "makespan": makespan,
+            "sequential": sum(
+                float(durations.get(module, default_duration))
+                for module in nx_digraph.nodes()
+            ),
+            "components": sorted(
+                sorted(component)
+                for component in nx.weakly_connected_components(nx_digraph)
+            ),
+            "waves": waves,
+        }
+
+    def get_critical_path(self, durations, default_duration=None):
+        """ Returns the critical path through the modules to upgrade or install
+
+        The predicted duration is the longest chain of dependent modules
+        weighted by their historical duration: no amount of parallel workers
+        can upgrade faster, so shortening it means optimizing or splitting
+        the modules on that path.
+
+        @:parameter durations dict<string, float> (module -> seconds)
+        @:parameter default_duration <float> (Used for unknown modules,
+            defaults to the mean of known durations)
+        @:returns <dict>
+        """
+        graph = self._sub_graph_from_states(self._graph, [
+            States.TO_UPGRADE,
+            States.TO_INSTALL,
+        ])
+        nx_digraph = nx.DiGraph(graph)
+        known = [durations[m] for m in nx_digraph.nodes() if m in durations]
+        if default_duration is None:
+            default_duration = sum(known) / len(known) if known else 0.0
+
+        # Longest path ending at each module, in topological order
+        finish = {}
+        previous = {}
+        for module in nx.topological_sort(nx_digraph):
+            start = 0.0
+            for parent in nx_digraph.predecessors(module):
+                if finish[parent] > start:
+                    start = finish[parent]
+                    previous[module] = parent
+            finish[module] = start + float(durations.get(module, default_duration))
+
+        path = []
+        module = max(finish, key=finish.get) if finish else None
+        while module:
+            path.append({
+                "module": module,
+                "duration": float(durations.get(module, default_duration)),
+                "finish": finish[module],
+                "measured": module in durations,
+            })
+            module = previous.get(module)
+        return {
+            "predicted_duration": path[0]["finish"] if path else 0.0,
+            "sequential_duration": sum(
+                float(durations.get(m, default_duration))
+                for m in nx_digraph.nodes()
+            ),
+            "default_duration": default_duration,
+            "path": path[::-1],
+            "unmeasured": sorted(
+                m for m in nx_digraph.nodes() if m not in durations
+            ),
+        }
+
+    def get_modules_to_update_from_files(self, files):
+        """ Returns the minimal list of modules to update after files changed
+
+        Each file is mapped to its module, or to every module of a git
+        submodule when the submodule itself changed. Updating a module also
+        updates the installed modules depending on it, so modules having an
+        ancestor among the changed ones are not listed in "update".
+
+        @:parameter files list<string> (Changed file paths)
+        @:returns <dict>
+        """
+        paths, submodules = self._get_addons_index()
+        changed = set()
+        unmapped = []
+        for filename in files:
+            path = os.path.normpath(filename)
+            while path and path not in paths and path not in submodules:
+                parent = os.path.dirname(path)
+                path = parent if parent != path else ""
+            if path in paths:
+                changed.add(paths[path])
+            elif path in submodules:
+                changed.update(submodules[path])
+            else:
+                unmapped.append(filename)
+
+        ancestors = self._ancestors_index()
+        installed_states = (States.INSTALLED, States.TO_UPGRADE)
+        installed = {
+            m for m in changed
+            if m in ancestors and self._nodes.get_state(m) in installed_states
+        }
+        to_update = sorted(m for m in installed if not ancestors[m] & installed)
+        impacted = set(to_update)
+        impacted.update(
+            m for m, m_ancestors in ancestors.items()
+            if not m_ancestors.isdisjoint(to_update)
+            and self._nodes.get_state(m) in installed_states
+        )
+        return {
+            "changed": sorted(changed),
+            "update": to_update,
+            "impacted": sorted(impacted),
+            "unmapped": sorted(unmapped),
+        }
+
+    def simulate_install(self, install=(), uninstall=()):
+        """ Simulates Odoo installation of modules, auto_install included
+
+        Uninstalling a module also uninstalls the modules depending on it.
+        Installing a module also installs its dependencies, then Odoo
+        fixpoint is reproduced with a worklist: an uninstalled auto_install
+        module is installed once all its required dependencies are installed
+        and at least one of them is newly installed.
+
+        @:parameter install list<string> (Modules to install)
+        @:parameter uninstall list<string> (Modules to uninstall)
+        @:returns <dict>
+        """
+        installed_states = (States.INSTALLED, States.TO_UPGRADE)
+        installed = set(self._nodes.filter(installed_states))
+        to_install = set(self._nodes.filter([States.TO_INSTALL]))
+        reasons = {}
+        errors = {}
+
+        # Uninstallation cascades to dependent modules
+        to_uninstall = set()
+        worklist = [(m, None) for m in uninstall]
+        while worklist:
+            module, dependency = worklist.pop()
+            if module in to_uninstall or module not in self._nodes:
+                continue
+            to_uninstall.add(module)
+            reasons[module] = (
+                {"reason": "dependent", "because": [dependency]}
+                if dependency else {"reason": "requested"}
+            )
+            worklist.extend(
+                (child, module) for child in self._nodes.children(module)
+                if child in installed or child in to_install
+            )
+        installed -= to_uninstall
+        to_install -= to_uninstall
+
+        # Installation pulls dependencies, then auto installable dependents.
+        # Modules already to install and requested ones may trigger some too.
+        worklist = [(m, {"reason": "requested"}) for m in install]
+        candidates = [
+            child
+            for module in sorted(to_install | set(install))
+            if module in self._nodes
+            for child in self._nodes.children(module)
+        ]
+        while worklist or candidates:
+            while worklist:
+                module, reason = worklist.pop()
+                if module in installed or module in to_install:
+                    continue
+                if module not in self._nodes:
+                    errors[module] = "unknown module"
+                    continue
+                if module in to_uninstall:
+                    errors[module] = "uninstalled but required by {}".format(
+                        ", ".join(reason.get("because", []))
+                    )
+                    continue
+                if self._nodes.get_state(module) == States.UNINSTALLABLE:
+                    errors[module] = "not installable"
+                    continue
+                to_install.add(module)
+                reasons[module] = reason
+                worklist.extend(
+                    (parent, {"reason": "dependency", "because": [module]})
+                    for parent in self._nodes.parents(module)
+                )
+                candidates.extend(self._nodes.children(module))
+            while candidates and not worklist:
+                module = candidates.pop()
+                if (
+                        module in installed
+                        or module in to_install
+                        or module in to_uninstall
+                        or not self._nodes[module]["auto_install"]
+                ):
+                    continue
+                auto_install = self._nodes[module]["auto_install"]
+                required = (
+                    auto_install if isinstance(auto_install, tuple)
+                    else self._nodes.parents(module)
+                )
+                if not all(d in installed or d in to_install for d in required):
+                    continue
+                triggers = sorted(d for d in required if d in to_install)
+                if not triggers:
+                    continue
+                worklist.append((module, {
+                    "reason": "auto_install",
+                    "requires": sorted(required),
+                    "because": triggers,
+                }))
+
+        new_modules = to_install - set(self._nodes.filter([States.TO_INSTALL]))
+        return {
+            "install": sorted(new_modules),
+            "uninstall": sorted(to_uninstall),
+            "result": sorted(installed | to_install),
+            "extra": {
+                m: reasons[m] for m in sorted(reasons)
+                if reasons[m]["reason"] != "requested"
+            },
+            "errors": dict(sorted(errors.items())),
+        }
+
+    def get_minimal_upgrade_list(self, modules):
+        """ Returns an equivalent upgrade list without redundant modules
+
+        Upgrading a module also upgrades the installed modules depending on
+        it, so an installed module is redundant when one of its ancestors is
+        listed too. The original order is kept.
+
+        @:parameter modules list<string> (A module names list)
+        @:returns <dict>
+        """
+        ancestors = self._ancestors_index()
+        installed_states = (States.INSTALLED, States.TO_UPGRADE)
+        listed = {
+            m for m in modules
+            if m in ancestors and self._nodes.get_state(m) in installed_states
+        }
+        minimal = []
+        redundant = {}
+        for module in modules:
+            covering = ancestors.get(module, set()) & listed
+            if module in listed and covering:
+                redundant[module] = sorted(covering)
+            elif module not in minimal:
+                minimal.append(module)
+        return {
+            "minimal": minimal,
+            "redundant": redundant,
+            "unknown": [m for m in modules if m not in ancestors],
+        }
+
+    def get_uninstall_plan(self, modules, batch_size=10, table_dependencies=None):
+        """ Orders modules to uninstall in bounded batches, dependents first
+
+        A module is uninstalled before the modules it depends on. Tables
+        that could not be dropped (`drop_table_dependencies` of the
+        migration log parser) add constraints too: the module owning the
+        referencing table goes first. Tables are attributed to the listed
+        module with the longest name prefixing them.
+
+        @:parameter modules list<string> (A module names list)
+        @:parameter batch_size <int> (Maximum modules per batch)
+        @:parameter table_dependencies dict<string, dict<string, string>>
+            (table -> {referencing table: constraint})
+        @:returns <dict>
+        """
+        ancestors = self._ancestors_index()
+        to_uninstall = [m for m in dict.fromkeys(modules) if m in self._nodes]
+        listed = set(to_uninstall)
+
+        # blocked_by[m]: listed modules to uninstall before m
+        blocked_by = {m: set() for m in to_uninstall}
+        for module in to_uninstall:
+            for ancestor in ancestors.get(module, set()) & listed:
+                blocked_by[ancestor].add(module)
+
+        def table_owner(table):
+            owners = [m for m in listed if table == m or table.startswith(m + "_")]
+            return max(owners, key=len) if owners else None
+
+        table_constraints = []
+        for table, references in (table_dependencies or {}).items():
+            owner = table_owner(table)
+            for child_table in references:
+                child_owner = table_owner(child_table)
+                if (
+                        not owner or not child_owner or owner == child_owner
+                        # Never contradict module dependencies
+                        or child_owner in ancestors.get(owner, set())
+                ):
+                    continue
+                blocked_by[owner].add(child_owner)
+                table_constraints.append([child_owner, owner])
+
+        batches = []
+        done = set()
+        remaining = list(to_uninstall)
+        while remaining:
+            ready = [m for m in remaining if blocked_by[m] <= done]
+            if not ready:
+                # Cyclic table constraints, release them all at once
+                ready = remaining
+            for index in range(0, len(ready), max(batch_size, 1)):
+                batches.append(sorted(ready[index:index + max(batch_size, 1)]))
+            done.update(ready)
+            remaining = [m for m in remaining if m not in done]
+        return {
+            "batches": batches,
+            "unknown": [m for m in modules if m not in self._nodes],
+            "table_constraints": sorted(table_constraints),
+        }
+
+    @memoized_query
     def get_installed_modules(self, only_leaves=False):
-        modules = [m for m, v in self._nodes.items() if v["state"] == States.INSTALLED]
+        modules = self._nodes.filter([States.INSTALLED])
         if only_leaves:
-            modules = [m for m in modules if m in self.leaves()]
+            leaves = set(self.leaves())
+            modules = [m for m in modules if m in leaves]
         return sorted(modules)
 
+    def get_state_counts(self):
+        """ Returns the number of modules per state
+
+        @:returns dict<string, int>
+        """
+        return self._nodes.counts()
+
     def difference(self, odoo_modules):
         """ Returns a dict representing differences between two Odoo modules
 
         :param odoo_modules: <OdooModules>
         :return:
         """
-        old_modules = set(self.modules())
-        new_modules = set(odoo_modules.modules())
-        intersection = new_modules.intersection(old_modules)
-        old_difference = old_modules.difference(new_modules)
-        new_difference = new_modules.difference(old_modules)
-        changed_modules = {}
-        for module in intersection:
-            old_state = self.get_state(module)
-            new_state = odoo_modules.get_state(module)
-            if old_state != new_state:
-                changed_modules[module] = {
-                    "old_state": old_state,
-                    "new_state": new_state,
-                }
+        diff = self.changeset(odoo_modules, attributes=("state",))
+        changed_modules = {
+            module: {
+                "old_state": values["state"][0],
+                "new_state": values["state"][1],
+            }
+            for module, values in diff["attributes"].items()
+        }
         return {
-            "removed": sorted(list(old_difference - intersection)),
-            "added": sorted(list(new_difference - intersection)),
-            "changed": dict(sorted(changed_modules.items())),
+            "removed": diff["nodes"]["removed"],
+            "added": diff["nodes"]["added"],
+            "changed": changed_modules,
+            "dependencies": diff["edges"],
         }
 
-    def save_as(self, filename="modules_dependency_graph-{}.png"):
+    def save_as(self, filename="modules_dependency_graph-{}.png", **kwargs):
         """ Save the module dependencies graphically
 
-        Allowed file extensions:
-            "canon", "cmap", "cmapx", "cmapx_np", "dia", "dot",
-            "fig", "gd", "gd2", "gif", "hpgl", "imap", "imap_np",
-            "ismap", "jpe", "jpeg", "jpg", "mif", "mp", "pcl", "pdf",
-            "pic", "plain", "plain-ext", "png", "ps", "ps2", "svg",
-            "svgz", "vml", "vmlz", "vrml", "vtx", "wbmp", "xdot", "xlib"
+        See `AbstractGraph.save_as`, modules can also be collapsed by
+        "repository" (the addons folder holding them).
 
         @:parameter filename <string>
         @:returns <OdooModule>
         @:raise ModuleNotFoundError
         """
-        allowed_extensions = [
-            "canon", "cmap", "cmapx", "cmapx_np", "dia", "dot",
-            "fig", "gd", "gd2", "gif", "hpgl", "imap", "imap_np",
-            "ismap", "jpe", "jpeg", "jpg", "mif", "mp", "pcl", "pdf",
-            "pic", "plain", "plain-ext", "png", "ps", "ps2", "svg",
-            "svgz", "vml", "vmlz", "vrml", "vtx", "wbmp", "xdot", "xlib"
-        ]
-        name, extension = os.path.splitext(filename)
-        if extension.replace(".", "") in allowed_extensions:
-            self._graph.layout(prog="dot", args="-Nshape=box")
-            self._graph.draw(filename.format(self._name))
-            return self
-        raise Exception("Extension not allowed!")
+        return super().save_as(filename, **kwargs)
+
+
+def load_databases(databases, addons_paths=None, max_workers=None):
+    """ Load several databases concurrently
+
+    Manifest files are parsed once and shared by every loader, then each
+    database is loaded in its own thread (the work is mostly waiting for
+    psql), so the wall time is close to the slowest single load.
+
+    @:parameter databases list<string> (A database names list)
+    @:returns list<OdooModules> (in the same order as `databases`)
+    """
+    manifests = load_manifests(addons_paths)
+    with ThreadPoolExecutor(max_workers=max_workers or len(databases) or 1) as executor:
+        return list(executor.map(
+            lambda database: OdooModules(database, manifests=manifests),
+            databases
+        ))
+
+
+def difference_matrix(odoo_modules_list):
+    """ Returns pairwise differences and per module state timelines
+
+    Timelines follow the order of `odoo_modules_list` and only list modules
+    whose state is not the same in every database (None when absent).
+
+    @:parameter odoo_modules_list list<OdooModules>
+    @:returns dict
+    """
+    pairwise = {}
+    for index, from_modules in enumerate(odoo_modules_list):
+        for to_modules in odoo_modules_list[index + 1:]:
+            pairwise["{} -> {}".format(from_modules._name, to_modules._name)] = (
+                from_modules.difference(to_modules)
+            )
+
+    all_states = []
+    for odoo_modules in odoo_modules_list:
+        all_states.append({
+            module: odoo_modules.get_state(module)
+            for module in odoo_modules.modules()
+        })
+    timeline = {}
+    for module in sorted(set().union(*all_states)):
+        states = [states.get(module) for states in all_states]
+        if len(set(states)) > 1:
+            timeline[module] = states
+    return {
+        "databases": [odoo_modules._name for odoo_modules in odoo_modules_list],
+        "pairwise": pairwise,
+        "timeline": timeline,
+    }
@@ -66,6 +66,8 @@ import os
 import re
 import json
 
+from utils.migration_files import parse_uninstall_list
+
 DEFAULT_LOGFILE = "database_migration.log"
 UNINSTALLER_FILE = "./odoo/songs/migration/uninstall.py"
 MIGRATION_FILE = "odoo/migration.yml"
@@ -506,20 +508,7 @@ if __name__ == '__main__':
 
     RESULTS['modules']['to_install'] = all_modules_to_install
 
-    uninstall_module_list = []
-    with open(UNINSTALLER_FILE, 'r') as file:
-        content = '%%%'.join(
-            [line.rstrip(', \r\n').lstrip(' ') for line in file])
-        sub_content = content[content.find(
-            "UNINSTALL_MODULES_LIST = [") + 1:content.find("]")]
-        for line in sub_content.split("%%%"):
-            if not line:
-                continue
-            match = re.search(r"'" + MODULE_PATTERN_VAR + "'", line)
-            if not match:
-                continue
-            module_name = match.group(1)
-            uninstall_module_list.append(module_name)
+    uninstall_module_list = parse_uninstall_list(UNINSTALLER_FILE)
 
     RESULTS['modules']['remove_from_uninstaller'] = list(
         set(sum(all_modules_to_install.values(), []) + RESULTS['modules'][
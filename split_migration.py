@@ -1,14 +1,22 @@
 #!/usr/bin/env python
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from shutil import copyfile, move
+import re
+import shlex
 import signal
 import os
+import sys
+import time
 
 from ruamel.yaml import YAML, comments
 from subprocess import Popen, PIPE, STDOUT
 
+from utils.db import DatabaseControl
+from utils.log_sink import LevelCounter, LogSink, Trigger
+
 
 def raise_sigint(pid):
     """
@@ -29,28 +37,33 @@ def raise_sigint(pid):
             os.killpg(os.getpgid(pid), signal.SIGINT)
 
 
-def clean(path, element, i=0):
+def clean(path, element, i=0, keep=None):
+    """ Removes the values at `path`, or with `keep`, only the items of the
+    sequence at `path` for which `keep(item)` is false """
     # Stop invariant when all pathes have been consumed
     if not path:
         return element
     # Allow string pathes (with /) or list
     if isinstance(path, str):
         path = path.split("/")
-    if isinstance(element, comments.CommentedMap):
+    # Also plain containers, as returned by a previous clean
+    if isinstance(element, (comments.CommentedMap, dict)):
         output = {}
         i += 1
         for k, v in element.items():
             if path[0] == k:
                 if path[1:]:
-                    output[k] = clean(path[1:], v, i)
+                    output[k] = clean(path[1:], v, i, keep)
+                elif keep is not None and isinstance(v, list):
+                    output[k] = [e for e in v if keep(e)]
             else:
-                output[k] = clean(path, v, i)
+                output[k] = clean(path, v, i, keep)
         return output
-    elif isinstance(element, comments.CommentedSeq):
+    elif isinstance(element, (comments.CommentedSeq, list)):
         output = []
         for e in element:
             i += 1
-            output.append(clean(path, e, i))
+            output.append(clean(path, e, i, keep))
         return output
     return element
 
@@ -59,39 +72,176 @@ ODOODB = "odoodb"
 ODOODB_PRE = "odoodb_pre"
 ODOODB_POST = "odoodb_post"
 ODOODB_TEMPLATE = "odoodb_template"
+ODOODB_CHECKPOINT = "odoodb_ckpt_"
+ODOODB_MATRIX = "odoodb_mx_"
 MARABUNTA_COMMAND = 'docker-compose run --rm -e MARABUNTA_MODE=migration -e DB_NAME=%s odoo rundatabasemigration'
-DATABASE_CHECK_COMMAND = 'docker-compose run --rm odoo psql -c "\c %s"'
-DATABASE_DROP_COMMAND = 'docker-compose run --rm odoo psql dropdb %s'
-DATABASE_CREATE_COMMAND = 'docker-compose run --rm odoo psql createdb %s -T %s'
+# The migration file is mounted over the default one of the container
+MARABUNTA_FILE_COMMAND = 'docker-compose run --rm -v %s:/odoo/migration.yml:ro -e MARABUNTA_MODE=migration -e DB_NAME=%s odoo rundatabasemigration'
+# Cores used by one migration (Odoo and its PostgreSQL backend)
+CPUS_PER_MIGRATION = 2
+# Seconds between two load checks before starting a matrix run
+LOAD_POLL_INTERVAL = 15
+
 
+def run_marabunta(database, log_sink, running=None, migration_file=None):
+    """ Runs marabunta on a database, streaming its output to `log_sink`
 
-def cmd_exec(command, *args):
-    print("Executing: %s" % (command % args))
-    return Popen(
-        [command % args],
+    @:parameter running <dict> (Receives the process as "popen", e.g. for
+        log consumers to kill it)
+    @:parameter migration_file <string> (Host file used instead of
+        odoo/migration.yml)
+    @:returns <int> (marabunta return code)
+    """
+    command = MARABUNTA_COMMAND % database
+    if migration_file:
+        command = MARABUNTA_FILE_COMMAND % (
+            shlex.quote(os.path.abspath(migration_file)), database
+        )
+    # The os.setsid() is passed in the argument preexec_fn so
+    # it's run after the fork() and before  exec() to run the shell.
+    popen = Popen(
+        [command],
         shell=True,
         stdout=PIPE,
         stderr=STDOUT,
-    ).wait()
+        close_fds=True,
+        preexec_fn=os.setsid,
+        encoding="utf-8",
+        errors="replace",
+    )
+    if running is not None:
+        running["popen"] = popen
+    for line in popen.stdout:
+        log_sink.write(line)
+    return popen.wait()
+
+
+def migration_versions(data):
+    return [str(values["version"]) for values in data["migration"]["versions"]]
+
+
+def keep_versions(data, versions):
+    """ Returns migration data limited to `versions`, in their file order
+
+    @:parameter data <dict> (migration.yml content, see `clean`)
+    @:parameter versions list<string>
+    """
+    return clean(
+        'migration/versions', data,
+        keep=lambda values: str(values["version"]) in versions,
+    )
+
+
+def checkpoint_name(version):
+    return ODOODB_CHECKPOINT + re.sub(r"[^a-z0-9]+", "_", version.lower())
+
+
+def prune_checkpoints(databases, versions, keep):
+    """ Drops checkpoints of the oldest versions, keeping the `keep` last """
+    existing = databases.existing(checkpoint_name(v) for v in versions)
+    checkpoints = [checkpoint_name(v) for v in versions if checkpoint_name(v) in existing]
+    for name in checkpoints[:max(len(checkpoints) - keep, 0)]:
+        print("Dropping checkpoint {}".format(name))
+        databases.drop(name)
+
+
+def matrix_jobs(variants_count):
+    """ Returns how many migrations may run side by side on this host """
+    cpus = os.cpu_count() or 1
+    idle_cpus = cpus - os.getloadavg()[0]
+    return max(1, min(variants_count, int(idle_cpus // CPUS_PER_MIGRATION)))
+
+
+def wait_for_load():
+    """ Waits until the load average is below the number of cores
+
+    The Linux load average counts processes waiting on disks as well, so
+    this also holds runs back while the host is IO bound.
+    """
+    while os.getloadavg()[0] > (os.cpu_count() or 1):
+        time.sleep(LOAD_POLL_INTERVAL)
+
+
+def run_matrix(databases, variant_files, template, log_prefix, jobs=None, **log_options):
+    """ Runs each migration file variant on its own clone of `template`
+
+    Clones are created first (a template cannot be copied while in use),
+    then migrations run concurrently, each one with its own log.
+
+    @:parameter variant_files list<string> (migration.yml variants)
+    @:parameter jobs <int> (Concurrent migrations, guessed from the host
+        cores and load by default)
+    @:parameter log_options <dict> (see `LogSink`)
+    @:returns list<dict> (Variant, database, return code, duration, log
+        levels counts and files)
+    """
+    variants = []
+    for variant_file in variant_files:
+        name = os.path.splitext(os.path.basename(variant_file))[0]
+        name = re.sub(r"[^a-z0-9]+", "_", name.lower())
+        if any(variant["name"] == name for variant in variants):
+            raise Exception("Variant names must be unique: {}".format(name))
+        # Copied, so the variant run is not affected by later edits
+        migration_file = os.path.join("odoo", "migration_{}.yml".format(name))
+        if os.path.abspath(variant_file) != os.path.abspath(migration_file):
+            copyfile(variant_file, migration_file)
+        variants.append({
+            "name": name,
+            "database": ODOODB_MATRIX + name,
+            "migration_file": migration_file,
+        })
+
+    for variant in variants:
+        print("Cloning {} as {}".format(template, variant["database"]))
+        databases.drop(variant["database"])
+        databases.create(variant["database"], template)
+
+    def run_variant(variant):
+        wait_for_load()
+        level_counter = LevelCounter()
+        log_sink = LogSink(
+            "{}.{}".format(log_prefix, variant["name"]),
+            consumers=[level_counter],
+            **log_options
+        )
+        print("Migrating {}".format(variant["database"]))
+        started_at = time.time()
+        try:
+            returncode = run_marabunta(
+                variant["database"], log_sink, migration_file=variant["migration_file"]
+            )
+        finally:
+            log_sink.close()
+        return dict(
+            variant,
+            returncode=returncode,
+            seconds=round(time.time() - started_at),
+            levels=level_counter.counts,
+            log_files=log_sink.filenames,
+        )
+
+    jobs = jobs or matrix_jobs(len(variants))
+    print("Running {} variants, {} at a time".format(len(variants), jobs))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(run_variant, variants))
 
 
 if __name__ == "__main__":
 
     print("Starting procedural migration...")
     Popen(["docker-compose down --remove-orphans"], shell=True)
-    is_odoo_database_exists = not cmd_exec(DATABASE_CHECK_COMMAND, ODOODB)
-    is_template_database_exists = not cmd_exec(DATABASE_CHECK_COMMAND, ODOODB_TEMPLATE)
-    is_pre_database_exists = not cmd_exec(DATABASE_CHECK_COMMAND, ODOODB_PRE)
-    is_post_database_exists = not cmd_exec(DATABASE_CHECK_COMMAND, ODOODB_POST)
+    databases = DatabaseControl()
+    existing_databases = databases.existing([ODOODB, ODOODB_TEMPLATE, ODOODB_PRE, ODOODB_POST])
+    is_odoo_database_exists = ODOODB in existing_databases
+    is_template_database_exists = ODOODB_TEMPLATE in existing_databases
+    is_pre_database_exists = ODOODB_PRE in existing_databases
+    is_post_database_exists = ODOODB_POST in existing_databases
 
     if not is_template_database_exists:
         raise Exception(
             "The database 'odoodb_template' must exists to allow migration !"
         )
 
-    if is_odoo_database_exists:
-        cmd_exec(DATABASE_DROP_COMMAND, ODOODB)
-
     date_str = datetime.today().strftime("%Y_%m-%d_%H_%M")
     parser = argparse.ArgumentParser(description='Migration splitter')
     parser.add_argument(
@@ -105,8 +255,90 @@ if __name__ == "__main__":
         help='Execute post phase only (Remove pre phase)'
     )
 
+    parser.add_argument(
+        '--log-compress',
+        action='store_true',
+        help='Write the migration log gzipped'
+    )
+    parser.add_argument(
+        '--log-max-size',
+        type=int,
+        default=None,
+        help='Split the migration log in parts of this size (MiB)'
+    )
+
+    parser.add_argument(
+        '--checkpoints',
+        action='store_true',
+        help='Run versions one by one and snapshot the database after each'
+    )
+    parser.add_argument(
+        '--resume-from',
+        metavar='VERSION',
+        help='Restart at this version from the latest previous checkpoint'
+    )
+    parser.add_argument(
+        '--keep-checkpoints',
+        type=int,
+        default=3,
+        help='Number of checkpoints kept (oldest are dropped)'
+    )
+
+    parser.add_argument(
+        '--matrix',
+        nargs='+',
+        metavar='MIGRATION_FILE',
+        help='Run each migration file variant on its own template clone'
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='Concurrent matrix runs (default from host cores and load)'
+    )
+
     args = parser.parse_args()
+    if (args.checkpoints or args.resume_from) and (args.pre or args.post):
+        parser.error("--checkpoints and --resume-from run the whole migration")
+    if args.matrix and (args.pre or args.post or args.checkpoints or args.resume_from):
+        parser.error("--matrix runs whole migrations, without checkpoints")
     log_filename = "database_migration_{}.log".format(date_str)
+    log_options = dict(
+        compress=args.log_compress,
+        max_bytes=args.log_max_size and args.log_max_size * 1024 * 1024,
+    )
+
+    if args.matrix:
+        try:
+            results = run_matrix(
+                databases,
+                args.matrix,
+                ODOODB_TEMPLATE,
+                log_filename,
+                jobs=args.jobs,
+                **log_options
+            )
+        finally:
+            databases.close()
+        print("{:<24} {:<32} {:>6} {:>8}  {}".format(
+            "Variant", "Database", "Status", "Duration", "Log levels"
+        ))
+        for result in results:
+            print("{:<24} {:<32} {:>6} {:>7}s  {}".format(
+                result["name"],
+                result["database"],
+                "ok" if not result["returncode"] else result["returncode"],
+                result["seconds"],
+                ", ".join(
+                    "{} {}".format(count, level)
+                    for level, count in sorted(result["levels"].items())
+                ),
+            ))
+            print("    {}".format(", ".join(result["log_files"])))
+        sys.exit(1 if any(result["returncode"] for result in results) else 0)
+
+    if is_odoo_database_exists:
+        databases.drop(ODOODB)
     yaml_file = r'odoo/migration.yml'
     backup_file = r'odoo/migration.yml.bak'
 
@@ -132,12 +364,8 @@ if __name__ == "__main__":
             data_cleaned = clean(
                 'migration/versions/samples/operations/post', data_cleaned)
             if is_pre_database_exists:
-                cmd_exec(DATABASE_DROP_COMMAND, ODOODB_PRE)
-            Popen(
-                [DATABASE_CREATE_COMMAND % (ODOODB_PRE, ODOODB_TEMPLATE)],
-                shell=True,
-                stdout=PIPE
-            ).wait()
+                databases.drop(ODOODB_PRE)
+            databases.create(ODOODB_PRE, ODOODB_TEMPLATE)
             DATABASE_TO_MIGRATE = ODOODB_PRE
         elif args.post:
             data_cleaned = clean(
@@ -148,41 +376,92 @@ if __name__ == "__main__":
                 'migration/versions/samples/operations/post', data_cleaned)
             log_filename += ".post"
             if is_post_database_exists:
-                cmd_exec(DATABASE_DROP_COMMAND, ODOODB_POST)
+                databases.drop(ODOODB_POST)
             if is_pre_database_exists:
-                cmd_exec(DATABASE_CREATE_COMMAND, ODOODB_POST, ODOODB_PRE)
+                databases.create(ODOODB_POST, ODOODB_PRE)
             else:
                 raise Exception("Pre option hasn't been called yet.")
             DATABASE_TO_MIGRATE = ODOODB_POST
         else:
-            cmd_exec(DATABASE_CREATE_COMMAND, ODOODB, ODOODB_TEMPLATE)
+            source_database = ODOODB_TEMPLATE
+            versions = migration_versions(data_cleaned)
+            if args.resume_from:
+                if args.resume_from not in versions:
+                    raise Exception("Unknown version {}".format(args.resume_from))
+                previous_versions = versions[:versions.index(args.resume_from)]
+                existing_checkpoints = databases.existing(
+                    checkpoint_name(v) for v in previous_versions
+                )
+                for index in reversed(range(len(previous_versions))):
+                    if checkpoint_name(previous_versions[index]) in existing_checkpoints:
+                        source_database = checkpoint_name(previous_versions[index])
+                        versions = versions[index + 1:]
+                        break
+                else:
+                    print("No checkpoint before {}, starting from {}".format(
+                        args.resume_from, ODOODB_TEMPLATE
+                    ))
+                print("Resuming from {}, versions {}".format(
+                    source_database, ", ".join(versions)
+                ))
+                data_cleaned = keep_versions(data_cleaned, versions)
+            databases.create(ODOODB, source_database)
 
         with open(yaml_file, 'w') as output_stream:
             yaml.dump(data_cleaned, output_stream)
 
-    log_output = ""
-    try:
-        # The os.setsid() is passed in the argument preexec_fn so
-        # it's run after the fork() and before  exec() to run the shell.
-        popen = Popen(
-            [MARABUNTA_COMMAND % (DATABASE_TO_MIGRATE)],
-            shell=True,
-            stdout=PIPE,
-            stderr=STDOUT,
-            close_fds=True,
-            preexec_fn=os.setsid,
-        )
-        for binary in popen.stdout:
-            line = binary.decode('utf8')
-            log_output += line
-            if "|> version setup: " in line:
-                if args.pre and 'installation / upgrade of addons' in line:
-                    # Send the signal to all the process groups
-                    os.killpg(os.getpgid(popen.pid), signal.SIGKILL)
+    running = {}
+
+    def kill_migration(line):
+        # Send the signal to all the process groups
+        os.killpg(os.getpgid(running["popen"].pid), signal.SIGKILL)
 
-                print(line.rstrip("\n"))
+    def print_version_setup(line):
+        if "|> version setup: " in line:
+            print(line.rstrip("\n"))
+
+    level_counter = LevelCounter()
+    consumers = [print_version_setup, level_counter]
+    if args.pre:
+        consumers.insert(0, Trigger(
+            lambda line: "|> version setup: " in line
+            and 'installation / upgrade of addons' in line,
+            kill_migration,
+        ))
+    log_sink = LogSink(log_filename, consumers=consumers, **log_options)
+    try:
+        if args.checkpoints:
+            versions = migration_versions(data_cleaned)
+            all_versions = migration_versions(data)
+            for index, version in enumerate(versions):
+                # Versions already run are recorded in the database and
+                # skipped by marabunta
+                with open(yaml_file, 'w') as output_stream:
+                    yaml.dump(keep_versions(data_cleaned, versions[:index + 1]), output_stream)
+                if run_marabunta(DATABASE_TO_MIGRATE, log_sink, running):
+                    raise Exception(
+                        "Version {} failed, fix it then use --resume-from {}".format(
+                            version, version
+                        )
+                    )
+                log_sink.flush()
+                checkpoint = checkpoint_name(version)
+                print("Checkpoint {} after version {}".format(checkpoint, version))
+                databases.drop(checkpoint)
+                databases.create(checkpoint, DATABASE_TO_MIGRATE)
+                prune_checkpoints(databases, all_versions, args.keep_checkpoints)
+        else:
+            run_marabunta(DATABASE_TO_MIGRATE, log_sink, running)
 
     finally:
         # move(backup_file, yaml_file)
-        with open(log_filename, 'w') as log_file:
-            log_file.write(log_output)
+        databases.close()
+        log_sink.close()
+        print("Log written to {} ({} lines, {})".format(
+            ", ".join(log_sink.filenames),
+            log_sink.lines,
+            ", ".join(
+                "{} {}".format(count, level)
+                for level, count in sorted(level_counter.counts.items())
+            ) or "no log level",
+        ))
@@ -0,0 +1,60 @@
+import pytest
+
+import odoo_module_graph
+from odoo_module_graph import OdooModules
+from utils.memoize import QUERY_CACHE
+
+# module -> (database state, dependencies)
+DATABASE_MODULES = {
+    "base": ("installed", []),
+    "web": ("installed", ["base"]),
+    "mail": ("to upgrade", ["base", "web"]),
+    "sale": ("to upgrade", ["mail"]),
+    "crm": ("to install", ["mail"]),
+    "old_module": ("installed", ["base"]),
+}
+
+
+def database_modules(specs):
+    modules = {
+        name: {
+            "database_state": state,
+            "license": "LGPL-3",
+            "application": False,
+            "children": [],
+        }
+        for name, (state, depends) in specs.items()
+    }
+    for name, (state, depends) in specs.items():
+        for parent_name in depends:
+            modules[parent_name]["children"].append(name)
+    return modules
+
+
+def manifests(specs, auto_install=()):
+    return {
+        name: ({
+            "installable": name != "old_module",
+            "auto_install": name in auto_install,
+            "license": "LGPL-3",
+            "application": False,
+            "category": "Uncategorized",
+            "depends": depends,
+        }, "addons/{}/__manifest__.py".format(name))
+        for name, (state, depends) in specs.items()
+    }
+
+
+@pytest.fixture
+def make_modules(monkeypatch):
+    """ Returns a factory of OdooModules built from module specs instead of
+    a database and addons paths """
+
+    def make(specs=DATABASE_MODULES, database="odoodb", auto_install=()):
+        monkeypatch.setattr(
+            odoo_module_graph, "load_from_docker_psql", lambda name: database_modules(specs)
+        )
+        return OdooModules(database, manifests=manifests(specs, auto_install))
+
+    QUERY_CACHE.clear()
+    return make
@@ -0,0 +1,26 @@
+from conftest import DATABASE_MODULES
+
+
+def test_difference_added_dependency(make_modules):
+    old_modules = make_modules()
+    specs = dict(DATABASE_MODULES, crm=("to install", ["mail", "web"]))
+    new_modules = make_modules(specs, database="odoodb_new")
+
+    diff = old_modules.difference(new_modules)
+
+    # crm still depends on mail, although web -> crm is now redundant
+    assert diff["dependencies"] == {"added": [["web", "crm"]], "removed": []}
+    assert diff["added"] == diff["removed"] == []
+
+
+def test_difference_changed_state(make_modules):
+    old_modules = make_modules()
+    specs = dict(DATABASE_MODULES, sale=("installed", ["mail"]))
+    new_modules = make_modules(specs, database="odoodb_new")
+
+    diff = old_modules.difference(new_modules)
+
+    assert diff["changed"] == {
+        "sale": {"old_state": "to upgrade", "new_state": "installed"},
+    }
+    assert diff["dependencies"] == {"added": [], "removed": []}
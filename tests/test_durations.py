@@ -0,0 +1,24 @@
+from utils.durations import parse_module_durations
+
+LOG = """\
+2021-05-12 08:12:00,000 1 INFO odoodb odoo.modules.loading: Loading module sale (45/120)
+2021-05-12 08:12:00,100 1 INFO odoodb odoo.modules.loading: loading sale/security/ir.model.access.csv
+2021-05-12 08:12:09,000 1 INFO odoodb odoo.modules.loading: loading sale/views/sale_views.xml
+2021-05-12 08:12:10,000 1 INFO odoodb odoo.modules.loading: Loading module crm (46/120)
+2021-05-12 08:12:11,000 1 INFO odoodb odoo.modules.loading: loading crm/views/crm_views.xml
+2021-05-12 08:12:14,500 1 INFO odoodb odoo.modules.loading: 120 modules loaded in 80.00s, 0 queries
+"""
+
+
+def test_loading_durations_span_data_files():
+    durations = parse_module_durations(LOG.splitlines(keepends=True))
+    assert durations == {"sale": [10.0], "crm": [4.5]}
+
+
+def test_loading_closed_by_modules_loaded():
+    lines = [
+        "2021-05-12 08:12:00,000 1 INFO odoodb odoo.modules.loading: Loading module web (2/3)\n",
+        "2021-05-12 08:12:03,000 1 INFO odoodb odoo.modules.loading: Modules loaded.\n",
+        "2021-05-12 08:12:30,000 1 INFO odoodb odoo.service.server: Hit CTRL-C again\n",
+    ]
+    assert parse_module_durations(lines) == {"web": [3.0]}
@@ -0,0 +1,58 @@
+import csv
+import gzip
+import json
+
+import networkx as nx
+import pytest
+
+from utils.exporters import export
+
+NODES = [
+    ("base", {"state": "installed", "license": "LGPL-3"}),
+    ("sale & co", {"state": "to upgrade", "to_keep": True}),
+]
+EDGES = [("base", "sale & co")]
+
+
+def test_graphml(tmp_path):
+    filename = str(tmp_path / "graph.graphml")
+    export(filename, iter(NODES), iter(EDGES))
+    graph = nx.read_graphml(filename)
+    assert sorted(graph.edges()) == EDGES
+    assert graph.nodes["base"] == {"state": "installed", "license": "LGPL-3"}
+    assert graph.nodes["sale & co"] == {"state": "to upgrade", "to_keep": "true"}
+
+
+def test_ndjson_gzip(tmp_path):
+    filename = str(tmp_path / "graph.ndjson.gz")
+    export(filename, iter(NODES), iter(EDGES), attributes=("state",))
+    with gzip.open(filename, "rt", encoding="utf-8") as stream:
+        records = [json.loads(line) for line in stream]
+    assert records == [
+        {"type": "node", "id": "base", "state": "installed"},
+        {"type": "node", "id": "sale & co", "state": "to upgrade"},
+        {"type": "edge", "source": "base", "target": "sale & co"},
+    ]
+
+
+def test_csv_edges(tmp_path):
+    filename = str(tmp_path / "edges.txt")
+    export(filename, iter(NODES), iter(EDGES), fmt="csv")
+    with open(filename, newline="") as stream:
+        assert list(csv.reader(stream)) == [["source", "target"], ["base", "sale & co"]]
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(Exception, match="not allowed"):
+        export(str(tmp_path / "graph.png"), iter(NODES), iter(EDGES))
+
+
+def test_export_modules(make_modules, tmp_path):
+    modules = make_modules()
+    filename = str(tmp_path / "{}.jsonl")
+    modules.export(filename)
+    with open(str(tmp_path / "odoodb.jsonl")) as stream:
+        records = [json.loads(line) for line in stream]
+    nodes = {r["id"]: r for r in records if r["type"] == "node"}
+    assert nodes["mail"]["state"] == "to upgrade"
+    assert {"type": "edge", "source": "mail", "target": "sale"} in records
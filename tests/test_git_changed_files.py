@@ -0,0 +1,18 @@
+import subprocess
+
+import modules
+
+
+def test_renamed_files_report_both_paths(monkeypatch):
+    output = (
+        ":100644 100644 {a} {a} R100\0addons/sale_x/models/old.py\0addons/sale_y/models/new.py\0"
+        ":100644 100644 {a} {b} M\0addons/crm_x/views/crm.xml\0"
+    ).format(a="a" * 40, b="b" * 40)
+    monkeypatch.setattr(
+        subprocess, "check_output", lambda command, **kwargs: output.encode("utf-8")
+    )
+    assert modules.git_changed_files("HEAD~1..HEAD") == [
+        "addons/sale_x/models/old.py",
+        "addons/sale_y/models/new.py",
+        "addons/crm_x/views/crm.xml",
+    ]
@@ -0,0 +1,35 @@
+import time
+
+from utils.log_sink import LevelCounter, LogSink, Trigger, open_log
+
+
+def test_quiet_process_lines_are_flushed(tmp_path):
+    filename = str(tmp_path / "migration.log")
+    with LogSink(filename, flush_interval=0.05) as sink:
+        sink.write("only line\n")
+        time.sleep(0.3)
+        with open(filename) as log_file:
+            assert log_file.read() == "only line\n"
+
+
+def test_parts_are_split_on_encoded_bytes(tmp_path):
+    filename = str(tmp_path / "migration.log")
+    # 3 characters, 5 bytes once encoded: two lines exceed 8 bytes
+    with LogSink(filename, max_bytes=8, buffer_size=1, flush_interval=None) as sink:
+        for _ in range(3):
+            sink.write("éé\n")
+    assert sink.filenames == [filename, filename + ".1", filename + ".2"]
+
+
+def test_consumers_and_compression(tmp_path):
+    filename = str(tmp_path / "migration.log")
+    counter = LevelCounter()
+    triggered = []
+    with LogSink(filename, [counter, Trigger(lambda l: "boom" in l, triggered.append)],
+                 compress=True) as sink:
+        sink.write("2021-05-12 08:12:33,123 1 ERROR odoodb odoo: boom\n")
+        sink.write("2021-05-12 08:12:34,123 1 INFO odoodb odoo: boom\n")
+    assert counter.counts == {"ERROR": 1, "INFO": 1}
+    assert len(triggered) == 1
+    with open_log(sink.filenames[0]) as log_file:
+        assert len(log_file.readlines()) == 2
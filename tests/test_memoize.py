@@ -0,0 +1,54 @@
+import pytest
+
+from conftest import DATABASE_MODULES
+from utils.memoize import QUERY_CACHE
+
+
+@pytest.fixture
+def modules(make_modules):
+    return make_modules()
+
+
+def assert_plain(value):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            assert type(key) is str
+            assert_plain(item)
+    elif isinstance(value, list):
+        for item in value:
+            assert_plain(item)
+    else:
+        assert type(value) in (str, bool, int, float)
+
+
+@pytest.mark.parametrize("query, args", [
+    ("leaves", ()),
+    ("get_dependencies", ("mail",)),
+    ("get_optimized_modules_dependencies", ()),
+    ("get_modules_to_update", ()),
+    ("get_modules_to_install", ()),
+    ("get_modules_to_remove", ()),
+    ("get_installed_modules", ()),
+    ("get_installed_modules", (True,)),
+])
+def test_memoized_query_twice(modules, query, args):
+    first = getattr(modules, query)(*args)
+    second = getattr(modules, query)(*args)
+    assert first == second
+    assert_plain(first)
+    assert_plain(second)
+    # Results are copies, callers may modify them
+    if isinstance(second, list):
+        second.append("changed")
+        assert getattr(modules, query)(*args) == first
+
+
+def test_fingerprint_declared_dependencies(make_modules):
+    specs = dict(DATABASE_MODULES)
+    # Same reduced edges: crm -> web is implied by crm -> mail -> web
+    specs["crm"] = ("to install", ["mail", "web"])
+    first = make_modules().get_optimized_modules_dependencies()
+    second = make_modules(specs).get_optimized_modules_dependencies()
+    QUERY_CACHE.clear()
+    assert second == make_modules(specs).get_optimized_modules_dependencies()
+    assert first != second
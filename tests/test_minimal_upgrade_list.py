@@ -0,0 +1,17 @@
+from conftest import DATABASE_MODULES
+
+SPECS = dict(DATABASE_MODULES, **{
+    "stock": ("installed", ["base"]),
+    "sale_stock": ("installed", ["sale", "stock"]),
+})
+
+
+def test_redundant_modules_are_dropped(make_modules):
+    modules = make_modules(SPECS)
+    result = modules.get_minimal_upgrade_list(
+        ["sale_stock", "mail", "sale", "stock", "crm", "mail", "missing"]
+    )
+    # Order is kept, crm is not installed so upgrading mail does not cover it
+    assert result["minimal"] == ["mail", "stock", "crm", "missing"]
+    assert result["redundant"] == {"sale_stock": ["mail", "sale", "stock"], "sale": ["mail"]}
+    assert result["unknown"] == ["missing"]
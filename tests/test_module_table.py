@@ -0,0 +1,60 @@
+import itertools
+
+from odoo_module_graph import ModuleTable, States
+
+
+def make_table(pairs):
+    return ModuleTable.from_dict({
+        "m{}".format(index): {
+            "database_state": database_state,
+            "manifest_state": manifest_state,
+            "children": [],
+        }
+        for index, (database_state, manifest_state) in enumerate(pairs)
+    })
+
+
+def test_merge_states_matches_merge():
+    pairs = list(itertools.product(States.codes, repeat=2))
+    table = make_table(pairs)
+    table.merge_states()
+    assert [table.get_state(name) for name in table] == [
+        States.merge(database_state, manifest_state)
+        for database_state, manifest_state in pairs
+    ]
+
+
+def test_merge_states_empty_table():
+    table = ModuleTable()
+    table.merge_states()
+    assert table.state == bytearray()
+
+
+def test_columns_and_adjacency():
+    table = ModuleTable.from_dict({
+        "base": {"database_state": States.INSTALLED, "children": ["web", "mail"]},
+        "web": {"database_state": States.INSTALLED, "license": "LGPL-3", "children": ["mail"]},
+        "mail": {
+            "database_state": States.TO_UPGRADE,
+            "application": True,
+            "auto_install": ["web"],
+            "children": ["unknown"],
+        },
+    })
+    assert table.names == ["base", "web", "mail", "unknown"]
+    assert table.children("base") == ["web", "mail"]
+    assert table.children("unknown") == []
+    assert sorted(table.parents("mail")) == ["base", "web"]
+
+    row = table["mail"]
+    assert row["application"] is True
+    assert row["auto_install"] == ("web",)
+    assert row["children"] == ["unknown"]
+    assert row.get("license", "none") == "none"
+    row["state"] = States.TO_REMOVE
+    assert table.get_state("mail") == States.TO_REMOVE
+
+    table.state = bytearray(table.database_state)
+    assert table.filter([States.INSTALLED]) == ["base", "web"]
+    assert table.filter([States.INSTALLED, False], invert=True) == ["mail"]
+    assert table.counts() == {States.INSTALLED: 2, States.TO_UPGRADE: 1}
@@ -0,0 +1,18 @@
+import odoo_module_graph
+from conftest import DATABASE_MODULES
+
+SPECS = dict(DATABASE_MODULES, sale_crm=("uninstalled", ["sale", "crm"]))
+
+
+def test_impacted_modules_are_installed(make_modules, monkeypatch):
+    monkeypatch.setattr(odoo_module_graph, "get_git_submodules", lambda: [])
+    modules = make_modules(SPECS)
+    result = modules.get_modules_to_update_from_files([
+        "addons/mail/models/mail.py",
+        "addons/sale/views/sale.xml",
+        "README.md",
+    ])
+    assert result["changed"] == ["mail", "sale"]
+    assert result["update"] == ["mail"]
+    assert result["impacted"] == ["mail", "sale"]
+    assert result["unmapped"] == ["README.md"]
@@ -0,0 +1,65 @@
+import hierarchical_table_graph
+from hierarchical_table_graph import leaves_first, refresh_from_docker_psql
+from utils.node_store import NodeStore
+
+
+def make_store(rows):
+    store = NodeStore(("key",))
+    for record_id, parent_id, name in rows:
+        store.add(record_id, parent_id, name, ("",))
+    store.link_children()
+    return store
+
+
+def test_refresh_moves_record_under_later_parent(monkeypatch):
+    store = make_store([(1, None, "root"), (2, 1, "child")])
+    changed_rows = [
+        # 2 moves under 3, which is created and streamed after it
+        ["2", "3", "child", ""],
+        ["3", "1", "new parent", "kept"],
+    ]
+
+    def stream(database, sql_query):
+        if sql_query.startswith("select coalesce"):
+            return iter([["2024-01-02 00:00:00", "3"]])
+        if sql_query.startswith("select id from"):
+            return iter([["1"], ["2"], ["3"]])
+        return iter(changed_rows)
+
+    monkeypatch.setattr(hierarchical_table_graph, "stream_from_docker_psql", stream)
+    changes = refresh_from_docker_psql(
+        "odoodb", store, ["2024-01-01 00:00:00", 2],
+        extra_columns=("key",),
+        keep_predicate=lambda record: record["key"] == "kept",
+    )
+
+    assert changes["moved"] == {2: 1}
+    assert {record_id: record.children for record_id, record in store.items()} == {
+        1: {3}, 2: set(), 3: {2},
+    }
+    assert [store[i].to_keep for i in (1, 2, 3)] == [True, False, True]
+    assert leaves_first(store, [1, 2, 3]) == [2, 3, 1]
+
+
+def test_refresh_overlaps_watermark(monkeypatch):
+    store = make_store([(1, None, "root"), (2, 1, "child")])
+    queries = []
+
+    def stream(database, sql_query):
+        queries.append(sql_query)
+        if sql_query.startswith("select coalesce"):
+            return iter([["2024-01-02 00:00:00", "2"]])
+        if sql_query.startswith("select id from"):
+            return iter([["1"], ["2"]])
+        # 1 is unchanged, 2 was written by a transaction started before
+        # the previous watermark was read
+        return iter([["1", "", "root", ""], ["2", "1", "renamed", ""]])
+
+    monkeypatch.setattr(hierarchical_table_graph, "stream_from_docker_psql", stream)
+    changes = refresh_from_docker_psql(
+        "odoodb", store, ["2024-01-01 00:00:00", 2], extra_columns=("key",), overlap=60,
+    )
+
+    assert "write_date > '2024-01-01 00:00:00'::timestamp - interval '60 seconds'" in queries[1]
+    assert changes["changed"] == [2]
+    assert store[2].name == "renamed"
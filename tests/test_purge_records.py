@@ -0,0 +1,20 @@
+from hierarchical_table_graph import purge_records
+from utils import db
+
+
+def test_docker_purge_counts_deleted_rows(monkeypatch):
+    monkeypatch.delenv("PGHOST", raising=False)
+    # Stands for psql: echoes the statements, each chunk deleting one row
+    monkeypatch.setattr(
+        db, "DOCKER_PSQL_SCRIPT_COMMAND", "sed -e 's/^DELETE .*/DELETE 1/' # {}"
+    )
+    stats = purge_records("odoodb", "ir_ui_view", [5, 4, 3, 2, 1], chunk_size=2)
+    assert stats["chunks"] == 3
+    assert stats["deleted"] == 3
+
+
+def test_dry_run():
+    stats = purge_records("odoodb", "ir_ui_view", [3, 2, 1], dry_run=True)
+    assert stats["deleted"] == 0
+    assert stats["to_delete"] == 3
+    assert "rows_per_second" not in stats
@@ -0,0 +1,68 @@
+import networkx as nx
+
+from utils import remove_node, remove_nodes
+from utils.render import new_graph
+
+
+def make_graph(edges, nodes=()):
+    graph = new_graph()
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from(edges)
+    return graph
+
+
+def edges(graph):
+    return sorted((str(s), str(t)) for s, t in graph.iteredges())
+
+
+def test_chain():
+    graph = make_graph([("a", "b"), ("b", "c"), ("c", "d")])
+    remove_nodes(graph, ["b", "c"])
+    assert sorted(graph.nodes()) == ["a", "d"]
+    assert edges(graph) == [("a", "d")]
+
+
+def test_cycle_among_removed_nodes():
+    graph = make_graph([("a", "b"), ("b", "c"), ("c", "b"), ("c", "d"), ("b", "e")])
+    remove_nodes(graph, ["b", "c"])
+    assert edges(graph) == [("a", "d"), ("a", "e")]
+
+
+def test_several_sources_and_targets():
+    graph = make_graph([
+        ("a1", "x"), ("a2", "x"), ("x", "y"), ("y", "b1"), ("x", "b2"), ("a1", "b1"),
+    ])
+    remove_nodes(graph, ["x", "y"])
+    assert edges(graph) == [("a1", "b1"), ("a1", "b2"), ("a2", "b1"), ("a2", "b2")]
+
+
+def test_no_self_loop_through_removed_nodes():
+    graph = make_graph([("a", "b"), ("b", "a"), ("b", "c")])
+    remove_nodes(graph, ["b"])
+    assert edges(graph) == [("a", "c")]
+
+
+def test_unknown_and_isolated_nodes():
+    graph = make_graph([("a", "b")], nodes=["z"])
+    remove_nodes(graph, ["missing", "z"])
+    assert sorted(graph.nodes()) == ["a", "b"]
+    assert edges(graph) == [("a", "b")]
+
+
+def test_reachability_is_kept():
+    graph = make_graph([
+        ("a", "b"), ("b", "c"), ("c", "d"), ("a", "e"), ("e", "c"), ("d", "f"), ("e", "f"),
+    ])
+    before = nx.transitive_closure(nx.DiGraph(edges(graph)))
+    removed = ["c", "e"]
+    remove_nodes(graph, removed)
+    after = nx.transitive_closure(nx.DiGraph(edges(graph)))
+    assert sorted(after.edges()) == sorted(
+        (s, t) for s, t in before.edges() if s not in removed and t not in removed
+    )
+
+
+def test_remove_node():
+    graph = make_graph([("a", "b"), ("b", "c")])
+    remove_node(graph, "b")
+    assert edges(graph) == [("a", "c")]
@@ -0,0 +1,30 @@
+from utils.render import collapse, neighborhood, new_graph, render_fingerprint
+
+
+def make_graph():
+    graph = new_graph()
+    graph.add_edge("a", "b")
+    graph.add_edge("b", "c")
+    graph.add_edge("a", "d")
+    return graph
+
+
+def test_render_fingerprint_edge_labels():
+    graph = make_graph()
+    clusters = {"a": "x", "b": "y", "c": "y", "d": "y"}
+    first = collapse(graph, clusters.get)
+    graph.add_edge("a", "c")
+    second = collapse(graph, clusters.get)
+    # Same nodes and edges, only the edge count label changed
+    assert first.edges() == second.edges()
+    assert render_fingerprint(first) != render_fingerprint(second)
+
+
+def test_neighborhood_standalone():
+    graph = make_graph()
+    graph.get_node("b").attr["color"] = "red"
+    subgraph = neighborhood(graph, "b")
+    assert sorted(subgraph.nodes()) == ["a", "b", "c"]
+    assert sorted(subgraph.edges()) == [("a", "b"), ("b", "c")]
+    assert subgraph.get_node("b").attr["color"] == "red"
+    assert graph.subgraphs() == []
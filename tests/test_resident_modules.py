@@ -0,0 +1,57 @@
+import socket
+
+import odoo_module_graph
+import modules
+from utils import daemon
+
+
+def test_reload_on_database_change(monkeypatch):
+    signatures = {"odoodb": "10|2024-01-01 00:00:00|20"}
+    loads = []
+    monkeypatch.setattr(odoo_module_graph, "manifests_signature", lambda: "code")
+    monkeypatch.setattr(
+        odoo_module_graph, "database_signature", lambda database: signatures[database]
+    )
+    monkeypatch.setattr(modules, "load_modules", lambda database: loads.append(database) or len(loads))
+    resident = modules.ResidentModules(ttl=300, check_interval=0)
+
+    assert resident.get("odoodb") == 1
+    assert resident.get("odoodb") == 1
+    # e.g. a module was upgraded
+    signatures["odoodb"] = "10|2024-01-02 00:00:00|20"
+    assert resident.get("odoodb") == 2
+    assert loads == ["odoodb", "odoodb"]
+
+
+def test_signature_checked_once_per_interval(monkeypatch):
+    checks = []
+    monkeypatch.setattr(odoo_module_graph, "manifests_signature", lambda: "code")
+    monkeypatch.setattr(
+        odoo_module_graph, "database_signature", lambda database: checks.append(database) or "db"
+    )
+    monkeypatch.setattr(modules, "load_modules", lambda database: database)
+    now = [1000.0]
+    monkeypatch.setattr(modules.time, "time", lambda: now[0])
+    resident = modules.ResidentModules(ttl=300, check_interval=10)
+
+    assert resident.get("odoodb") == "odoodb"
+    resident.get("odoodb")
+    assert len(checks) == 1
+    now[0] += 11
+    resident.get("odoodb")
+    assert len(checks) == 2
+    resident.refresh("odoodb")
+    resident.get("odoodb")
+    assert len(checks) == 3
+
+
+def test_query_timeout(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(1)
+    try:
+        # Accepted by the kernel but never answered
+        assert daemon.query(socket_path, {"command": "ping"}, timeout=0.1) is None
+    finally:
+        server.close()
@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import DATABASE_MODULES
+
+SPECS = dict(DATABASE_MODULES, **{
+    "sale_crm": ("uninstalled", ["sale", "crm"]),
+    "crm_auto": ("uninstalled", ["crm", "web"]),
+    "sale_extra": ("uninstalled", ["sale"]),
+})
+
+
+@pytest.fixture
+def modules(make_modules):
+    return make_modules(SPECS, auto_install=("sale_crm", "crm_auto"))
+
+
+@pytest.mark.parametrize("install", [[], ["crm"]])
+def test_auto_install_from_modules_to_install(modules, install):
+    result = modules.simulate_install(install)
+    assert result["install"] == ["crm_auto", "sale_crm"]
+    assert result["extra"]["crm_auto"] == {
+        "reason": "auto_install",
+        "requires": ["crm", "web"],
+        "because": ["crm"],
+    }
+    assert result["errors"] == {}
+
+
+def test_install_pulls_dependencies(modules):
+    result = modules.simulate_install(["sale_extra"])
+    assert result["install"] == ["crm_auto", "sale_crm", "sale_extra"]
+    assert "sale_extra" not in result["extra"]
+
+
+def test_uninstall_cascades(modules):
+    result = modules.simulate_install(uninstall=["crm"])
+    assert result["uninstall"] == ["crm"]
+    assert result["install"] == []
+    assert "crm" not in result["result"]
+
+
+def test_install_errors(modules):
+    result = modules.simulate_install(["unknown"], uninstall=["mail"])
+    assert result["errors"]["unknown"] == "unknown module"
+    assert result["uninstall"] == ["crm", "mail", "sale"]
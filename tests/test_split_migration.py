@@ -0,0 +1,76 @@
+import io
+import os
+
+import split_migration
+
+
+class FakePopen:
+    commands = []
+
+    def __init__(self, command, **kwargs):
+        FakePopen.commands.append(command[0])
+        self.pid = 0
+        self.stdout = io.StringIO("done\n")
+
+    def wait(self):
+        return 0
+
+
+class FakeSink:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+
+def test_variant_file_is_mounted(monkeypatch):
+    FakePopen.commands = []
+    monkeypatch.setattr(split_migration, "Popen", FakePopen)
+    sink = FakeSink()
+
+    assert not split_migration.run_marabunta(
+        "odoodb_mx_songs", sink, migration_file="odoo/migration_songs.yml"
+    )
+    assert FakePopen.commands == [
+        "docker-compose run --rm -v {}:/odoo/migration.yml:ro "
+        "-e MARABUNTA_MODE=migration -e DB_NAME=odoodb_mx_songs odoo "
+        "rundatabasemigration".format(os.path.abspath("odoo/migration_songs.yml"))
+    ]
+    assert sink.lines == ["done\n"]
+
+
+MIGRATION = """\
+migration:
+  options:
+    install_command: odoo
+  versions:
+    - version: setup
+      operations:
+        pre:
+          - echo pre
+        post:
+          - echo post
+    - version: 14.0.1.0
+      operations:
+        post:
+          - echo post
+    - version: 14.0.2.0
+"""
+
+
+def load_migration():
+    from ruamel.yaml import YAML
+    return YAML().load(MIGRATION)
+
+
+def test_keep_versions():
+    data = split_migration.keep_versions(load_migration(), ["14.0.1.0", "14.0.2.0"])
+    assert split_migration.migration_versions(data) == ["14.0.1.0", "14.0.2.0"]
+    assert data["migration"]["options"] == {"install_command": "odoo"}
+
+
+def test_chained_clean():
+    data = split_migration.clean('migration/versions/operations/post', load_migration())
+    data = split_migration.clean('migration/versions/operations/pre', data)
+    assert [v.get("operations") for v in data["migration"]["versions"]] == [{}, {}, None]
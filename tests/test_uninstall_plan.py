@@ -0,0 +1,50 @@
+import pytest
+
+from conftest import DATABASE_MODULES
+
+SPECS = dict(DATABASE_MODULES, **{
+    "stock": ("installed", ["base"]),
+    "sale_stock": ("installed", ["sale", "stock"]),
+})
+
+
+@pytest.fixture
+def modules(make_modules):
+    return make_modules(SPECS)
+
+
+def test_dependents_first(modules):
+    plan = modules.get_uninstall_plan(["mail", "stock", "sale_stock", "sale", "missing"])
+    assert plan["batches"] == [["sale_stock"], ["sale", "stock"], ["mail"]]
+    assert plan["unknown"] == ["missing"]
+    assert plan["table_constraints"] == []
+
+
+def test_batch_size(modules):
+    plan = modules.get_uninstall_plan(["stock", "crm", "old_module"], batch_size=2)
+    assert plan["batches"] == [["crm", "stock"], ["old_module"]]
+
+
+def test_table_constraints(modules):
+    plan = modules.get_uninstall_plan(["stock", "crm"], table_dependencies={
+        # crm_lead references stock_picking: crm goes first
+        "stock_picking": {"crm_lead": "crm_lead_picking_id_fkey"},
+    })
+    assert plan["batches"] == [["crm"], ["stock"]]
+    assert plan["table_constraints"] == [["crm", "stock"]]
+
+
+def test_table_constraints_never_contradict_dependencies(modules):
+    plan = modules.get_uninstall_plan(["mail", "sale"], table_dependencies={
+        "sale_order": {"mail_message": "mail_message_res_id_fkey"},
+    })
+    assert plan["batches"] == [["sale"], ["mail"]]
+    assert plan["table_constraints"] == []
+
+
+def test_cyclic_table_constraints(modules):
+    plan = modules.get_uninstall_plan(["stock", "crm"], table_dependencies={
+        "stock_picking": {"crm_lead": "crm_lead_picking_id_fkey"},
+        "crm_lead": {"stock_picking": "stock_picking_lead_id_fkey"},
+    })
+    assert plan["batches"] == [["crm", "stock"]]
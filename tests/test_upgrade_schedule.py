@@ -0,0 +1,39 @@
+import pytest
+
+from conftest import DATABASE_MODULES
+
+SPECS = dict(DATABASE_MODULES, **{
+    "sale_crm": ("to install", ["sale", "crm"]),
+    "stock": ("to upgrade", ["base"]),
+    "website": ("installed", ["web"]),
+})
+
+
+@pytest.fixture
+def modules(make_modules):
+    return make_modules(SPECS)
+
+
+def test_waves_follow_dependencies(modules):
+    schedule = modules.get_upgrade_schedule(
+        workers=2, durations={"mail": 5, "stock": 3, "sale": 2}
+    )
+    assert [
+        [(w["upgrade"], w["install"]) for w in wave["workers"]]
+        for wave in schedule["waves"]
+    ] == [
+        [(["mail"], []), (["stock"], [])],
+        [(["sale"], []), ([], ["crm"])],
+        [([], ["sale_crm"])],
+    ]
+    assert [wave["duration"] for wave in schedule["waves"]] == [5.0, 2.0, 1.0]
+    assert schedule["makespan"] == 8.0
+    assert schedule["sequential"] == 12.0
+    assert schedule["components"] == [["crm", "mail", "sale", "sale_crm"], ["stock"]]
+
+
+def test_single_worker(modules):
+    schedule = modules.get_upgrade_schedule()
+    assert all(len(wave["workers"]) == 1 for wave in schedule["waves"])
+    # One worker runs everything in sequence
+    assert schedule["makespan"] == schedule["sequential"] == 5.0
@@ -0,0 +1,62 @@
+import hierarchical_table_graph
+from utils.view_arch import attribute_value, parse_arch, validate_tree
+
+FORM = '<form><div class="oe_title main"><field name="name"/></div></form>'
+
+
+def test_hasclass_xpath():
+    views = {
+        1: (None, "primary", 16, FORM),
+        2: (1, "extension", 16,
+            '<xpath expr="//div[hasclass(\'oe_title\')]" position="inside">'
+            '<field name="ref"/></xpath>'),
+        3: (1, "extension", 17,
+            '<xpath expr="//div[hasclass(\'oe_title\', \'missing\')]" position="inside">'
+            '<field name="code"/></xpath>'),
+    }
+    errors = validate_tree(views, 1)
+    assert [error["view_id"] for error in errors] == [3]
+
+
+def test_attributes_add_keeps_attribute():
+    views = {
+        1: (None, "primary", 16, FORM),
+        2: (1, "extension", 16,
+            '<xpath expr="//div[hasclass(\'oe_title\')]" position="attributes">'
+            '<attribute name="class" add="o_big" separator=" "/></xpath>'),
+        3: (1, "extension", 17,
+            '<xpath expr="//div[hasclass(\'oe_title\', \'o_big\')]" position="inside">'
+            '<field name="ref"/></xpath>'),
+    }
+    assert validate_tree(views, 1) == []
+
+
+def test_attribute_value():
+    def value(current, spec):
+        return attribute_value(current, parse_arch(spec))
+
+    assert value("a b", '<attribute name="class" add="c" remove="a" separator=" "/>') == "b c"
+    assert value("a,b", '<attribute name="groups" remove="b"/>') == "a"
+    assert value("a", '<attribute name="groups" remove="a"/>') == ""
+    assert value(None, '<attribute name="invisible" add="1"/>') == "1"
+    assert value("1", '<attribute name="invisible">0</attribute>') == "0"
+    assert value("1", '<attribute name="invisible"/>') == ""
+
+
+def test_inactive_views_are_not_loaded(monkeypatch):
+    rows = [
+        ["1", "", "primary", "16", FORM],
+        ["2", "1", "extension", "16", '<field name="name" position="after"/>'],
+        # 3 is inactive, so not returned by the query: 4 inherits from it
+        ["4", "3", "extension", "16", '<field name="missing" position="after"/>'],
+    ]
+    queries = []
+
+    def stream(database, sql_query):
+        queries.append(sql_query)
+        return iter(rows)
+
+    monkeypatch.setattr(hierarchical_table_graph, "stream_from_docker_psql", stream)
+    views = hierarchical_table_graph.load_view_arches("odoodb")
+    assert "where active" in queries[0]
+    assert sorted(views) == [1, 2]
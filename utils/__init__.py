@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import heapq
 
 
 def to_native(source, encoding="utf-8", falsy_empty=False):
@@ -58,20 +59,87 @@ def add_node(graph, name, values, color, fillcolor, group):
     return graph
 
 
+def remove_nodes(graph, nodes):
+    """ Removes nodes and reconnects their predecessors to their successors
+
+    Reachability between remaining nodes is kept: every remaining node
+    reaching another one through removed nodes only gets a direct edge.
+    Edges are read once, and the removed nodes are contracted strongly
+    connected component by component in reverse topological order, so
+    each kept target set is computed once.
+
+    @:parameter graph <pygraphviz.AGraph>
+    @:parameter nodes iterable<string>
+    @:returns <pygraphviz.AGraph>
+    """
+    import networkx as nx
+
+    removed = {str(node) for node in nodes if graph.has_node(node)}
+    if not removed:
+        return graph
+    inner = nx.DiGraph()
+    inner.add_nodes_from(removed)
+    # Kept successors of removed nodes, and removed successors of kept nodes
+    kept_targets = {node: set() for node in removed}
+    entries = {}
+    for source, target in graph.iteredges():
+        source, target = str(source), str(target)
+        if source in removed:
+            if target in removed:
+                inner.add_edge(source, target)
+            else:
+                kept_targets[source].add(target)
+        elif target in removed:
+            entries.setdefault(target, []).append(source)
+
+    condensed = nx.condensation(inner)
+    reachable = {}
+    for component in reversed(list(nx.topological_sort(condensed))):
+        targets = set()
+        for node in condensed.nodes[component]["members"]:
+            targets.update(kept_targets[node])
+        for successor in condensed.successors(component):
+            targets.update(reachable[successor])
+        reachable[component] = targets
+
+    mapping = condensed.graph["mapping"]
+    new_edges = [
+        (source, target)
+        for node, sources in entries.items()
+        for source in sources
+        for target in reachable[mapping[node]]
+        if source != target
+    ]
+    graph.remove_nodes_from(removed)
+    graph.add_edges_from(new_edges)
+    return graph
+
+
 def remove_node(graph, node):
     """ Removing a node implies to remove everything related: node and edges
         Then reconstructs all edges from predecessors to successors:
             node(edge(n), edge(m)) implies edge(n*m)
     """
-    if graph.has_node(node):
-        # Keep dependencies
-        predecessors = graph.predecessors(node)
-        successors = graph.successors(node)
-        # Purge node and edges
-        graph.remove_node(node)
-        for edge in graph.edges(node):
-            graph.remove_edge(edge.source, edge.target)
-        # Then reconstructs all edges
-        for (p, s) in zip(predecessors, successors):
-            graph.add_edge(p, s)
-    return graph
+    return remove_nodes(graph, [node])
+
+
+def balance(weights, workers):
+    """ Split weighted items between workers, heaviest first (LPT rule)
+
+    Each item goes to the least loaded worker, which keeps the makespan
+    within 4/3 of the optimal one.
+
+    @:parameter weights dict<string, float> (item -> weight)
+    @:parameter workers <int>
+    @:returns list<(float, list<string>)> (load and items per non empty worker)
+    """
+    loads = [(0.0, index, []) for index in range(max(workers, 1))]
+    for item in sorted(weights, key=lambda i: (-weights[i], i)):
+        load, index, items = heapq.heappop(loads)
+        items.append(item)
+        heapq.heappush(loads, (load + weights[item], index, items))
+    return [
+        (load, sorted(items))
+        for load, index, items in sorted(loads, key=lambda l: l[1])
+        if items
+    ]
@@ -6,6 +6,13 @@ import pygraphviz
 import networkx as nx
 
 from . import add_node, clean_graph, check_node, leaves
+from .exporters import EXPORT_ATTRIBUTES, export
+from .graph_diff import DIFF_ATTRIBUTES, changeset, declared_successors
+from .memoize import memoized_query
+from .render import collapse, graph_fingerprint, neighborhood, render
+
+# Node store attributes query results depend on
+FINGERPRINT_NODE_ATTRIBUTES = DIFF_ATTRIBUTES + ("submodule",)
 
 
 class AbstractGraph:
@@ -14,6 +21,8 @@ class AbstractGraph:
     _nodes = {}
     _graph = None
     _exclude_nodes = []
+    _ancestors = None
+    _fingerprint = None
 
     def __init__(
             self,
@@ -105,18 +114,65 @@ class AbstractGraph:
         clean_graph(graph)
         return graph
 
+    def _invalidate(self):
+        """ Forgets everything computed from the graph, to call on changes """
+        self._fingerprint = None
+        self._ancestors = None
+
+    def _ancestors_index(self):
+        """ Returns the ancestors of every node, computed once per graph
+
+        @:returns dict<string, set<string>>
+        """
+        if self._ancestors is None:
+            nx_digraph = nx.DiGraph(self._graph)
+            ancestors = {}
+            for node in nx.topological_sort(nx_digraph):
+                node_ancestors = set()
+                for parent in nx_digraph.predecessors(node):
+                    node_ancestors.add(parent)
+                    node_ancestors.update(ancestors[parent])
+                ancestors[node] = node_ancestors
+            self._ancestors = ancestors
+        return self._ancestors
+
+    def _cluster_of(self, name, collapse_by):
+        """ Returns the cluster of a node when collapsing graphs """
+        values = self._nodes.get(name)
+        if not values:
+            return None
+        return str(values.get(collapse_by) or "")
+
     #
     # Builtin functions
     #
 
     def __hash__(self):
-        return self._nodes.__hash__()
+        return int(self.fingerprint()[:16], 16)
 
     #
     # Public API
     # DO NOT USE IN PRIVATE METHODS
     #
 
+    def fingerprint(self):
+        """ Returns a stable hash of nodes, edges and relevant attributes
+
+        Declared children are hashed too: queries read them from the node
+        store, and they differ between graphs with the same reduced edges.
+
+        @:returns <string>
+        """
+        if self._fingerprint is None:
+            self._fingerprint = graph_fingerprint(
+                self._graph,
+                nodes=self._nodes,
+                node_attributes=FINGERPRINT_NODE_ATTRIBUTES,
+                successors=declared_successors(self._graph, self._nodes),
+            )
+        return self._fingerprint
+
+    @memoized_query
     def get_dependencies(self, name):
         """ Returns the dependency list of a node
 
@@ -135,6 +191,7 @@ class AbstractGraph:
         """
         return self._graph.nodes()
 
+    @memoized_query
     def leaves(self):
         """ Return nodes not in dependency of any other node
 
@@ -149,17 +206,55 @@ class AbstractGraph:
         :param abstract_graph: <AbstractGraph>
         :return:
         """
-        old_nodes = set(self.nodes())
-        new_nodes = set(abstract_graph.nodes())
-        intersection = new_nodes.intersection(old_nodes)
-        old_difference = old_nodes.difference(new_nodes)
-        new_difference = new_nodes.difference(old_nodes)
+        diff = self.changeset(abstract_graph, attributes=())
         return {
-            "removed": sorted(list(old_difference - intersection)),
-            "added": sorted(list(new_difference - intersection)),
+            "removed": diff["nodes"]["removed"],
+            "added": diff["nodes"]["added"],
         }
 
-    def save_as(self, filename="nodes_dependency_graph-{}.png", dpi=None):
+    def changeset(self, abstract_graph, attributes=DIFF_ATTRIBUTES):
+        """ Returns nodes, edges and attributes changes with another graph
+
+        :param abstract_graph: <AbstractGraph>
+        :param attributes: list<string> (Node attributes to compare)
+        :return: {"nodes": {added, removed}, "edges": {added, removed},
+                  "attributes": {node: {attribute: [old, new]}}}
+        """
+        return changeset(
+            self._graph, self._nodes,
+            abstract_graph._graph, abstract_graph._nodes,
+            attributes,
+        )
+
+    def export(self, filename, fmt=None, attributes=EXPORT_ATTRIBUTES):
+        """ Stream nodes and edges to GraphML, NDJSON or CSV edges
+
+        No layout is computed and nothing is serialized in memory, so it
+        works for graphs too big to be drawn.
+
+        @:parameter filename <string> (".graphml", ".ndjson", ".jsonl" or
+            ".csv", optionally followed by ".gz")
+        @:parameter fmt <string> (Overrides the format guessed from filename)
+        @:parameter attributes list<string> (Node attributes to export)
+        @:returns <AbstractGraph>
+        """
+        nodes = (
+            (str(node), self._nodes.get(str(node)) or {})
+            for node in self._graph.iternodes()
+        )
+        edges = ((str(s), str(t)) for s, t in self._graph.iteredges())
+        export(filename.format(self._name), nodes, edges, fmt, attributes)
+        return self
+
+    def save_as(
+            self,
+            filename="nodes_dependency_graph-{}.png",
+            dpi=None,
+            collapse_by=None,
+            focus=None,
+            hops=1,
+            prog=None,
+    ):
         """ Save the node dependencies graphically
 
         Allowed file extensions:
@@ -169,7 +264,16 @@ class AbstractGraph:
             "pic", "plain", "plain-ext", "png", "ps", "ps2", "svg",
             "svgz", "vml", "vmlz", "vrml", "vtx", "wbmp", "xdot", "xlib"
 
+        Big graphs are laid out with `sfdp` unless `prog` is given, and
+        renderings are cached so drawing the same graph twice is instant.
+
         @:parameter filename <string>
+        @:parameter dpi <int>
+        @:parameter collapse_by <string> (Draws one node per value of this
+            attribute)
+        @:parameter focus <string> (Only draws this node neighborhood)
+        @:parameter hops <int> (Neighborhood size around `focus`)
+        @:parameter prog <string> (Graphviz layout program)
         @:returns <Odoonode>
         @:raise nodeNotFoundError
         """
@@ -181,11 +285,16 @@ class AbstractGraph:
             "svgz", "vml", "vmlz", "vrml", "vtx", "wbmp", "xdot", "xlib"
         ]
         name, extension = os.path.splitext(filename)
-        args = ""
+        if extension.replace(".", "") not in allowed_extensions:
+            raise Exception("Extension not allowed!")
+        graph = self._graph
+        if focus:
+            check_node(graph, focus)
+            graph = neighborhood(graph, focus, hops)
+        if collapse_by:
+            graph = collapse(graph, lambda node: self._cluster_of(node, collapse_by))
+        args = "-Nshape=box"
         if dpi:
-            args += f"-Gdpi={dpi}"
-        if extension.replace(".", "") in allowed_extensions:
-            self._graph.layout(prog="dot", args="-Nshape=box")
-            self._graph.draw(filename.format(self._name), args=args)
-            return self
-        raise Exception("Extension not allowed!")
+            args += f" -Gdpi={dpi}"
+        render(graph, filename.format(self._name), prog=prog, args=args)
+        return self
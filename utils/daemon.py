@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+import json
+import os
+import socket
+import socketserver
+
+# Seconds a client waits for an answer, a daemon stuck loading a graph
+# must not block it forever
+QUERY_TIMEOUT = 120
+
+
+def query(socket_path, request, timeout=QUERY_TIMEOUT):
+    """ Send a request to a running daemon and wait for its answer
+
+    @:parameter socket_path <string> (Unix socket path)
+    @:parameter request <dict> (JSON serializable request)
+    @:parameter timeout <float> (Seconds, None waits forever)
+    @:returns <dict> or None if no daemon answers on `socket_path` in time
+    """
+    if not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Stale socket file, the daemon is gone
+        client.close()
+        return None
+    except socket.timeout:
+        client.close()
+        return None
+    try:
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with client.makefile("rb") as stream:
+            line = stream.readline()
+    except socket.timeout:
+        return None
+    finally:
+        client.close()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+def serve(socket_path, handler):
+    """ Answer newline delimited JSON requests on a Unix socket until killed
+
+    Each request is passed to `handler(request)` which returns the JSON
+    serializable result. Errors are sent back as `{"error": message}` so
+    clients can tell them apart from results.
+
+    @:parameter socket_path <string> (Unix socket path)
+    @:parameter handler <callable> (dict -> object)
+    """
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    response = {"result": handler(json.loads(line.decode("utf-8")))}
+                except Exception as e:
+                    response = {"error": "{}: {}".format(type(e).__name__, e)}
+                self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        if query(socket_path, {"command": "ping"}) is not None:
+            raise Exception("A daemon is already listening on {}".format(socket_path))
+        os.remove(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
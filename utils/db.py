@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+import os
+import threading
+from contextlib import contextmanager
+from subprocess import Popen, PIPE
+
+try:
+    import psycopg2
+    from psycopg2 import pool, sql
+except ImportError:
+    psycopg2 = None
+
+# Direct connections are only made to an explicitly configured server (a
+# DSN or PGHOST): libpq defaults would reach a PostgreSQL running on the
+# host instead of the docker-compose one
+DOCKER_PSQL_SCRIPT_COMMAND = "docker-compose run --rm -T odoo psql -v ON_ERROR_STOP=1 -d {}"
+DOCKER_DATABASES_COMMAND = "docker-compose run --rm -T odoo psql -At -d postgres -c 'select datname from pg_database'"
+DOCKER_DROP_COMMAND = "docker-compose run --rm -T odoo dropdb --if-exists {}"
+DOCKER_CREATE_COMMAND = "docker-compose run --rm -T odoo createdb {} -T {}"
+MAINTENANCE_DATABASE = "postgres"
+POOL_MAX_CONNECTIONS = 4
+
+_pools = {}
+
+
+def direct_connection(dsn=None):
+    """ Returns whether the database server can be reached without docker
+
+    @:returns <bool> (psycopg2 is available and a DSN or PGHOST is set)
+    """
+    return psycopg2 is not None and bool(dsn or os.environ.get("PGHOST"))
+
+
+def get_pool(database, dsn=None):
+    """ Returns the connection pool of a database, shared by all callers
+
+    @:returns <psycopg2.pool.ThreadedConnectionPool> or None when no
+        direct connection is possible (see `direct_connection`)
+    """
+    if not direct_connection(dsn):
+        return None
+    key = (database, dsn)
+    if key not in _pools:
+        _pools[key] = pool.ThreadedConnectionPool(
+            1, POOL_MAX_CONNECTIONS, dsn or "", dbname=database
+        )
+    return _pools[key]
+
+
+@contextmanager
+def connection(database, dsn=None):
+    """ Borrows a pooled connection, given back when leaving the context """
+    db_pool = get_pool(database, dsn)
+    if db_pool is None:
+        raise Exception(
+            "Direct database connections require psycopg2 and a DSN or PGHOST"
+        )
+    conn = db_pool.getconn()
+    try:
+        yield conn
+    finally:
+        db_pool.putconn(conn)
+
+
+def run_docker_psql_script(database, statements):
+    """ Pipes SQL statements to a single psql process run by docker-compose
+
+    Output is read while statements are written, so psql never blocks on a
+    full pipe.
+
+    @:parameter statements iterable<string>
+    @:returns (<int>, list<string>) (psql return code and command tags,
+        e.g. "DELETE 1000")
+    """
+    proc = Popen(
+        [DOCKER_PSQL_SCRIPT_COMMAND.format(database)], stdin=PIPE, stdout=PIPE, shell=True
+    )
+    tags = []
+    reader = threading.Thread(target=lambda: tags.extend(
+        line.decode("utf-8", "replace").strip() for line in proc.stdout
+    ))
+    reader.start()
+    try:
+        for statement in statements:
+            proc.stdin.write(statement.encode("utf-8") + b"\n")
+    finally:
+        proc.stdin.close()
+        reader.join()
+        proc.stdout.close()
+    return proc.wait(), tags
+
+
+class DatabaseControl:
+    """ Lists, drops and creates databases over one maintenance connection
+
+    The connection is only used when a server is explicitly configured
+    (see `direct_connection`). Otherwise, or when it cannot be reached, the
+    docker-compose commands are used instead, listing all databases with a
+    single psql call.
+    """
+
+    def __init__(self, dsn=None, maintenance_database=MAINTENANCE_DATABASE):
+        self.dsn = dsn
+        self.maintenance_database = maintenance_database
+        self._conn = None
+        self._direct = direct_connection(dsn)
+
+    def _cursor(self):
+        """ Returns a cursor of the maintenance connection, or None if the
+        docker fallback must be used """
+        if not self._direct:
+            return None
+        if self._conn is None:
+            try:
+                self._conn = psycopg2.connect(self.dsn or "", dbname=self.maintenance_database)
+            except psycopg2.OperationalError as e:
+                print("Direct connection failed, using docker: {}".format(e))
+                self._direct = False
+                return None
+            # CREATE/DROP DATABASE cannot run in a transaction
+            self._conn.autocommit = True
+        return self._conn.cursor()
+
+    def existing(self, names):
+        """ Returns which of `names` are existing databases
+
+        @:parameter names iterable<string>
+        @:returns set<string>
+        """
+        names = set(names)
+        cr = self._cursor()
+        if cr is None:
+            proc = Popen([DOCKER_DATABASES_COMMAND], stdout=PIPE, shell=True)
+            output = proc.communicate()[0].decode("utf-8")
+            if proc.returncode:
+                raise Exception("Cannot list databases")
+            return names.intersection(output.split())
+        with cr:
+            cr.execute(
+                "SELECT datname FROM pg_database WHERE datname = ANY(%s)",
+                (list(names),),
+            )
+            return {row[0] for row in cr.fetchall()}
+
+    def exists(self, name):
+        return name in self.existing([name])
+
+    def _disconnect(self, cr, name):
+        """ Closes other sessions on a database, which would prevent
+        dropping it or using it as a template """
+        cr.execute(
+            "SELECT pg_terminate_backend(pid) FROM pg_stat_activity"
+            " WHERE datname = %s AND pid <> pg_backend_pid()",
+            (name,),
+        )
+
+    def drop(self, name):
+        cr = self._cursor()
+        if cr is None:
+            if Popen([DOCKER_DROP_COMMAND.format(name)], shell=True).wait():
+                raise Exception("Cannot drop database {}".format(name))
+            return
+        with cr:
+            self._disconnect(cr, name)
+            cr.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)))
+
+    def create(self, name, template):
+        """ Creates `name` as a copy of `template` """
+        cr = self._cursor()
+        if cr is None:
+            if Popen([DOCKER_CREATE_COMMAND.format(name, template)], shell=True).wait():
+                raise Exception("Cannot create database {} from {}".format(name, template))
+            return
+        with cr:
+            self._disconnect(cr, template)
+            cr.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+                sql.Identifier(name), sql.Identifier(template)
+            ))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+import re
+from datetime import datetime
+
+from .log_sink import open_log
+
+MODULE_PATTERN_VAR = r"([a-z0-9_]+)"
+
+# "module sale: loading 1.23s"
+MODULE_LOADING_PATTERN = r"module " + MODULE_PATTERN_VAR + r": loading ([0-9]+\.[0-9]+)s"
+# "Module sale loaded in 1.23s, 456 queries"
+MODULE_LOADED_PATTERN = r"Module " + MODULE_PATTERN_VAR + r" loaded in ([0-9]+\.[0-9]+)s"
+# "2021-05-12 08:12:33,123 1 INFO odoodb odoo.modules.loading: Loading module sale (45/120)"
+LOADING_MODULE_PATTERN = r"^([0-9]{4}-[0-9]{2}-[0-9]{2} [0-9:]{8},[0-9]{3}) .*Loading module " + MODULE_PATTERN_VAR + r" \([0-9]+/[0-9]+\)"
+# The end of the loading phase closes the last "Loading module" line:
+# "... odoo.modules.loading: 120 modules loaded in 12.34s, 0 queries"
+# "... odoo.modules.loading: Modules loaded."
+LOADING_END_PATTERN = r"^([0-9]{4}-[0-9]{2}-[0-9]{2} [0-9:]{8},[0-9]{3}) .*modules\.loading: ([0-9]+ modules loaded|Modules loaded\.)"
+# Marabunta step durations, "text: 12.34s"
+STEP_MIGRATION_DURATION = r"(.*): ([0-9]+\.[0-9]+)s$"
+
+
+def _timestamp(value):
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S,%f")
+
+
+def parse_module_durations(lines, modules=None):
+    """ Returns measured durations per module from an Odoo/marabunta log
+
+    Explicit durations are used when Odoo logs them, else the time between
+    a "Loading module" line and the next one, or the end of the loading
+    phase (the lines in between are the module own data files loading). Marabunta step
+    durations are attributed to a module only when `modules` is given and
+    the step text names exactly one of them.
+
+    @:parameter lines iterable<string>
+    @:parameter modules set<string> (Known module names)
+    @:returns dict<string, list<float>> (module -> measured durations)
+    """
+    durations = {}
+    loading = None
+    for line in lines:
+        match = (
+            re.search(MODULE_LOADED_PATTERN, line)
+            or re.search(MODULE_LOADING_PATTERN, line)
+        )
+        if match:
+            durations.setdefault(match.group(1), []).append(float(match.group(2)))
+            # Explicit duration wins over the timestamp based one
+            loading = None
+            continue
+
+        match = re.search(LOADING_MODULE_PATTERN, line)
+        end = not match and re.search(LOADING_END_PATTERN, line)
+        if (match or end) and loading:
+            module, started_at = loading
+            ended_at = _timestamp((match or end).group(1))
+            durations.setdefault(module, []).append((ended_at - started_at).total_seconds())
+            loading = None
+        if match:
+            loading = (match.group(2), _timestamp(match.group(1)))
+            continue
+
+        if modules:
+            match = re.search(STEP_MIGRATION_DURATION, line.rstrip("\n"))
+            if not match:
+                continue
+            names = set(re.findall(MODULE_PATTERN_VAR, match.group(1))) & modules
+            if len(names) == 1:
+                durations.setdefault(names.pop(), []).append(float(match.group(2)))
+    return durations
+
+
+def load_module_durations(filenames, modules=None):
+    """ Returns the mean duration per module measured over several logs
+
+    @:parameter filenames list<string> (Log files, gzipped or not)
+    @:parameter modules set<string> (Known module names)
+    @:returns dict<string, float> (module -> seconds)
+    """
+    measures = {}
+    for filename in filenames:
+        with open_log(filename) as log_file:
+            for module, values in parse_module_durations(log_file, modules).items():
+                measures.setdefault(module, []).extend(values)
+    return {
+        module: sum(values) / len(values)
+        for module, values in measures.items()
+    }
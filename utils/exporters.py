@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+import csv
+import gzip
+import json
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+EXPORT_ATTRIBUTES = ("state", "license", "submodule", "website_id", "to_keep")
+EXPORT_FORMATS = {
+    ".graphml": "graphml",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".csv": "csv",
+}
+# Written in big chunks, exports are a few 100k small lines
+BUFFER_SIZE = 1024 * 1024
+
+
+def _to_text(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return "" if value is None else str(value)
+
+
+def write_graphml(stream, nodes, edges, attributes=EXPORT_ATTRIBUTES):
+    """ Write nodes and edges as GraphML, one element at a time
+
+    @:parameter stream <file> (Text stream)
+    @:parameter nodes iterable<(string, dict)> (node name, attributes)
+    @:parameter edges iterable<(string, string)> (source, target)
+    @:parameter attributes list<string> (Node attributes to export)
+    """
+    stream.write(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    )
+    for attribute in attributes:
+        stream.write('  <key id={0} for="node" attr.name={0} attr.type="string"/>\n'.format(
+            quoteattr(attribute)
+        ))
+    stream.write('  <graph edgedefault="directed">\n')
+    for name, values in nodes:
+        stream.write("    <node id={}>".format(quoteattr(name)))
+        for attribute in attributes:
+            value = values.get(attribute)
+            if value is not None:
+                stream.write("<data key={}>{}</data>".format(
+                    quoteattr(attribute), escape(_to_text(value))
+                ))
+        stream.write("</node>\n")
+    for source, target in edges:
+        stream.write('    <edge source={} target={}/>\n'.format(
+            quoteattr(source), quoteattr(target)
+        ))
+    stream.write("  </graph>\n</graphml>\n")
+
+
+def write_ndjson(stream, nodes, edges, attributes=EXPORT_ATTRIBUTES):
+    """ Write one JSON object per node then per edge
+
+    @:parameter stream <file> (Text stream)
+    @:parameter nodes iterable<(string, dict)> (node name, attributes)
+    @:parameter edges iterable<(string, string)> (source, target)
+    @:parameter attributes list<string> (Node attributes to export)
+    """
+    for name, values in nodes:
+        record = {"type": "node", "id": name}
+        for attribute in attributes:
+            value = values.get(attribute)
+            if value is not None:
+                record[attribute] = value
+        stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+    for source, target in edges:
+        stream.write(json.dumps(
+            {"type": "edge", "source": source, "target": target},
+            ensure_ascii=False
+        ) + "\n")
+
+
+def write_csv_edges(stream, nodes, edges, attributes=EXPORT_ATTRIBUTES):
+    """ Write the edge list as CSV, nodes are not exported
+
+    @:parameter stream <file> (Text stream)
+    @:parameter edges iterable<(string, string)> (source, target)
+    """
+    writer = csv.writer(stream)
+    writer.writerow(["source", "target"])
+    writer.writerows(edges)
+
+
+WRITERS = {
+    "graphml": write_graphml,
+    "ndjson": write_ndjson,
+    "csv": write_csv_edges,
+}
+
+
+def export(filename, nodes, edges, fmt=None, attributes=EXPORT_ATTRIBUTES):
+    """ Stream a graph to a file, gzip compressed when ending with ".gz"
+
+    The format is guessed from the file extension unless `fmt` is given.
+
+    @:parameter filename <string>
+    @:parameter nodes iterable<(string, dict)> (node name, attributes)
+    @:parameter edges iterable<(string, string)> (source, target)
+    @:parameter fmt <string> ("graphml", "ndjson" or "csv")
+    """
+    name, extension = os.path.splitext(filename)
+    compressed = extension == ".gz"
+    if compressed:
+        extension = os.path.splitext(name)[1]
+    fmt = fmt or EXPORT_FORMATS.get(extension)
+    if fmt not in WRITERS:
+        raise Exception("Export format not allowed!")
+    if compressed:
+        stream = gzip.open(filename, "wt", encoding="utf-8", newline="")
+    else:
+        stream = open(filename, "w", encoding="utf-8", newline="", buffering=BUFFER_SIZE)
+    with stream:
+        WRITERS[fmt](stream, nodes, edges, attributes)
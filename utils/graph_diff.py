@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+DIFF_ATTRIBUTES = ("state", "license", "website_id", "to_keep")
+
+
+def declared_successors(graph, nodes):
+    """ Returns the declared children of graph nodes
+
+    Children come from the node store, not from graph edges: graphs are
+    transitively reduced, so an edge disappears as soon as a longer path
+    exists although the dependency is still declared.
+
+    @:parameter graph <pygraphviz.AGraph> (Nodes to compare)
+    @:parameter nodes dict<string, dict> (Node attributes, with "children")
+    @:returns dict<string, list<string>>
+    """
+    names = {str(node) for node in graph.iternodes()}
+    successors = {}
+    for name in names:
+        values = nodes.get(name) or {}
+        successors[name] = [
+            str(child) for child in values.get("children") or ()
+            if str(child) in names
+        ]
+    return successors
+
+
+def node_hashes(successors, nodes, attributes):
+    """ Returns a content hash per node: attribute values and successors
+
+    Hashes are only comparable within the same process.
+
+    @:returns dict<string, int>
+    """
+    hashes = {}
+    for node, targets in successors.items():
+        values = nodes.get(node) or {}
+        hashes[node] = hash((
+            tuple(values.get(attribute) for attribute in attributes),
+            frozenset(targets),
+        ))
+    return hashes
+
+
+def changeset(old_graph, old_nodes, new_graph, new_nodes, attributes=DIFF_ATTRIBUTES):
+    """ Returns nodes, edges and attributes changes between two graphs
+
+    Edges are the declared children of the node stores (see
+    `declared_successors`). Nodes present in both graphs are compared by
+    content hash first, so only changed nodes are inspected in detail.
+
+    @:parameter old_graph <pygraphviz.AGraph>
+    @:parameter old_nodes dict<string, dict> (Node attributes)
+    @:parameter new_graph <pygraphviz.AGraph>
+    @:parameter new_nodes dict<string, dict> (Node attributes)
+    @:parameter attributes list<string> (Node attributes to compare)
+    @:returns <dict>
+    """
+    old_successors = declared_successors(old_graph, old_nodes)
+    new_successors = declared_successors(new_graph, new_nodes)
+    old_hashes = node_hashes(old_successors, old_nodes, attributes)
+    new_hashes = node_hashes(new_successors, new_nodes, attributes)
+
+    removed_nodes = old_hashes.keys() - new_hashes.keys()
+    added_nodes = new_hashes.keys() - old_hashes.keys()
+    changed_nodes = [
+        node for node in old_hashes.keys() & new_hashes.keys()
+        if old_hashes[node] != new_hashes[node]
+    ]
+
+    added_edges = [(n, t) for n in added_nodes for t in new_successors[n]]
+    removed_edges = [(n, t) for n in removed_nodes for t in old_successors[n]]
+    changed_attributes = {}
+    for node in changed_nodes:
+        old_targets = set(old_successors[node])
+        new_targets = set(new_successors[node])
+        added_edges.extend((node, t) for t in new_targets - old_targets)
+        removed_edges.extend((node, t) for t in old_targets - new_targets)
+        old_values = old_nodes.get(node) or {}
+        new_values = new_nodes.get(node) or {}
+        for attribute in attributes:
+            old_value = old_values.get(attribute)
+            new_value = new_values.get(attribute)
+            if old_value != new_value:
+                changed_attributes.setdefault(node, {})[attribute] = [old_value, new_value]
+
+    return {
+        "nodes": {
+            "added": sorted(added_nodes),
+            "removed": sorted(removed_nodes),
+        },
+        "edges": {
+            "added": sorted(list(e) for e in added_edges),
+            "removed": sorted(list(e) for e in removed_edges),
+        },
+        "attributes": dict(sorted(changed_attributes.items())),
+    }
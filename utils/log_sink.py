@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+import gzip
+import re
+import threading
+
+LOG_BUFFER_SIZE = 1024 * 1024
+# Buffered lines are written at least this often (seconds), by a timer
+LOG_FLUSH_INTERVAL = 2.0
+# "2021-05-12 08:12:33,123 1 ERROR odoodb odoo.modules.loading: ..."
+LOG_LEVEL_PATTERN = r"^[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9:]{8},[0-9]{3} [0-9]+ ([A-Z]+) "
+
+
+def open_log(filename):
+    """ Opens a log file for reading, compressed or not """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rt", encoding="utf-8", errors="replace")
+    return open(filename, "r", encoding="utf-8", errors="replace")
+
+
+class LogSink:
+    """ Writes log lines to a file as they arrive and tees them to consumers
+
+    Lines are written by chunks of `buffer_size` characters, and a timer
+    writes pending lines every `flush_interval` seconds even when the
+    process is quiet, so memory use does not grow with the log and a crash
+    loses at most the last chunk. When `max_bytes` is set, the log is split
+    in parts: `filename`, `filename.1`, `filename.2`... `max_bytes` counts
+    UTF-8 encoded bytes before compression, compressed parts are smaller.
+
+    Consumers are callables receiving each line, e.g. `LevelCounter` or
+    `Trigger` instances.
+    """
+
+    def __init__(
+            self,
+            filename,
+            consumers=(),
+            compress=False,
+            max_bytes=None,
+            buffer_size=LOG_BUFFER_SIZE,
+            flush_interval=LOG_FLUSH_INTERVAL,
+    ):
+        self.filename = filename
+        self.consumers = list(consumers)
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.filenames = []
+        self.lines = 0
+        self._buffer = []
+        self._buffered = 0
+        self._written = 0
+        self._stream = None
+        # Writes come from the caller thread and from the flush timer
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._open_part()
+        self._timer = None
+        if flush_interval:
+            self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._timer.start()
+
+    def _open_part(self):
+        filename = self.filename
+        if self.filenames:
+            filename += ".{}".format(len(self.filenames))
+        if self.compress:
+            filename += ".gz"
+            self._stream = gzip.open(filename, "wb")
+        else:
+            self._stream = open(filename, "wb")
+        self.filenames.append(filename)
+        self._written = 0
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def write(self, line):
+        self.lines += 1
+        for consumer in self.consumers:
+            consumer(line)
+        with self._lock:
+            self._buffer.append(line)
+            self._buffered += len(line)
+            full = self._buffered >= self.buffer_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._stream is None:
+                return
+            if self._buffer:
+                chunk = "".join(self._buffer).encode("utf-8")
+                self._buffer = []
+                self._buffered = 0
+                if self.max_bytes and self._written and self._written + len(chunk) > self.max_bytes:
+                    self._stream.close()
+                    self._open_part()
+                self._stream.write(chunk)
+                self._written += len(chunk)
+            self._stream.flush()
+
+    def close(self):
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+            self._timer = None
+        self.flush()
+        with self._lock:
+            if self._stream is not None:
+                self._stream.close()
+                self._stream = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LevelCounter:
+    """ Counts Odoo log lines per level (ERROR, WARNING...) """
+
+    def __init__(self):
+        self.counts = {}
+
+    def __call__(self, line):
+        match = re.match(LOG_LEVEL_PATTERN, line)
+        if match:
+            level = match.group(1)
+            self.counts[level] = self.counts.get(level, 0) + 1
+
+
+class Trigger:
+    """ Calls `action(line)` on the first line matching `predicate` """
+
+    def __init__(self, predicate, action):
+        self.predicate = predicate
+        self.action = action
+        self.triggered = False
+
+    def __call__(self, line):
+        if not self.triggered and self.predicate(line):
+            self.triggered = True
+            self.action(line)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+import functools
+import threading
+from collections import OrderedDict
+
+QUERY_CACHE_SIZE = 256
+
+
+class LRUCache:
+    """ Thread safe mapping keeping the `size` most recently used items """
+
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+QUERY_CACHE = LRUCache()
+_MISSING = object()
+
+
+def plain(value):
+    """ Returns a copy of a query result made of builtin types only
+
+    pygraphviz nodes are `str` subclasses bound to their graph, they cannot
+    be copied nor kept once the graph changes.
+    """
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, dict):
+        return {plain(k): plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return type(value)(plain(v) for v in value)
+    return value
+
+
+def memoized_query(method):
+    """ Caches a graph query by graph fingerprint and arguments
+
+    Graphs with the same content share results, and a modified graph gets
+    a new fingerprint so stale results are never returned (they are evicted
+    by the LRU policy). Results are cached as plain data (see `plain`) and
+    copied so callers may modify them.
+    Calls with unhashable arguments are not cached.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            key = (
+                self.fingerprint(),
+                method.__qualname__,
+                args,
+                frozenset(kwargs.items()),
+            )
+            result = QUERY_CACHE.get(key, _MISSING)
+        except TypeError:
+            return plain(method(self, *args, **kwargs))
+        if result is _MISSING:
+            result = plain(method(self, *args, **kwargs))
+            QUERY_CACHE.set(key, result)
+        return plain(result)
+
+    return wrapper
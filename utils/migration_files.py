@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+import ast
+
+MIGRATION_FILE = "odoo/migration.yml"
+UNINSTALLER_FILE = "./odoo/songs/migration/uninstall.py"
+
+
+def load_migration_file(path=MIGRATION_FILE):
+    """ Load a marabunta migration file keeping comments and layout
+
+    @:parameter path <string>
+    @:returns (<ruamel.yaml.YAML>, <ruamel.yaml.comments.CommentedMap>)
+    """
+    from ruamel.yaml import YAML
+    yaml = YAML()
+    yaml.indent(mapping=2, sequence=4, offset=2)
+    with open(path) as input_stream:
+        return yaml, yaml.load(input_stream)
+
+
+def save_migration_file(yaml, data, path=MIGRATION_FILE):
+    with open(path, "w") as output_stream:
+        yaml.dump(data, output_stream)
+
+
+def iter_upgrade_lists(data):
+    """ Yields every `upgrade` modules list of a migration file
+
+    Lists are read from `versions[].addons` and `versions[].modes.<mode>.addons`.
+
+    @:parameter data <dict> (Loaded migration file)
+    @:returns iterator<(string, list<string>)> (label "version[/mode]", list)
+    """
+    for version in data.get("migration", {}).get("versions", []) or []:
+        name = str(version.get("version"))
+        upgrade = (version.get("addons") or {}).get("upgrade")
+        if upgrade:
+            yield name, upgrade
+        for mode, values in (version.get("modes") or {}).items():
+            upgrade = ((values or {}).get("addons") or {}).get("upgrade")
+            if upgrade:
+                yield "{}/{}".format(name, mode), upgrade
+
+
+def parse_uninstall_list(path=UNINSTALLER_FILE, name="UNINSTALL_MODULES_LIST"):
+    """ Returns the modules listed in the uninstall song
+
+    The song is parsed as Python code: the list assigned to `name` is
+    evaluated when it is a literal, else its string constants are used.
+
+    @:parameter path <string>
+    @:returns list<string> (A module names list, in file order)
+    """
+    with open(path, "r") as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Assign):
+            continue
+        if not any(isinstance(t, ast.Name) and t.id == name for t in node.targets):
+            continue
+        try:
+            values = ast.literal_eval(node.value)
+        except ValueError:
+            values = [
+                n.value for n in ast.walk(node.value)
+                if isinstance(n, ast.Constant) and isinstance(n.value, str)
+            ]
+        modules = []
+        for value in values:
+            # Entries may be (module, ...) tuples
+            if isinstance(value, (list, tuple)):
+                value = value[0] if value else None
+            if isinstance(value, str) and value not in modules:
+                modules.append(value)
+        return modules
+    return []
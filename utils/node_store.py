@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+import json
+import os
+from collections.abc import Mapping
+
+NO_CHILDREN = frozenset()
+
+
+class NodeRecord:
+    """ One table row: fixed attributes in slots, extra columns in a tuple
+
+    Values are also readable as `record["name"]`, like the dicts rows used
+    to be stored in.
+    """
+
+    __slots__ = ("id", "parent_id", "name", "extra", "to_keep", "children", "_columns")
+
+    def __init__(self, record_id, parent_id, name, extra, columns):
+        self.id = record_id
+        self.parent_id = parent_id
+        self.name = name
+        self.extra = extra
+        self.to_keep = False
+        # Shared empty set until the first child is linked
+        self.children = NO_CHILDREN
+        self._columns = columns
+
+    def __getitem__(self, key):
+        if key in NodeRecord.__slots__:
+            return getattr(self, key)
+        try:
+            return self.extra[self._columns.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key != "to_keep":
+            raise KeyError(key)
+        self.to_keep = value
+
+    def __contains__(self, key):
+        return key in NodeRecord.__slots__ or key in self._columns
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def display_name(self):
+        """ Returns the former "id/key/name" node name """
+        key = self.get("key")
+        return "/".join([str(self.id)] + ([key] if key else []) + [self.name])
+
+
+class NodeStore(Mapping):
+    """ Records keyed by integer record id, children are sets of ids
+
+    Lookups accept ids as integers or as strings (graph node names).
+    """
+
+    def __init__(self, columns=()):
+        self.columns = tuple(columns)
+        self._records = {}
+
+    def add(self, record_id, parent_id, name, extra=()):
+        record = NodeRecord(record_id, parent_id, name, tuple(extra), self.columns)
+        self._records[record_id] = record
+        return record
+
+    def link_children(self):
+        """ Fills children sets from parent ids, once all records are added """
+        for record in self._records.values():
+            parent = self._records.get(record.parent_id)
+            if parent is None:
+                continue
+            if parent.children is NO_CHILDREN:
+                parent.children = set()
+            parent.children.add(record.id)
+
+    def ancestors_closure(self, record_ids):
+        """ Returns records ids with all their ancestors
+
+        Parent chains are walked upward and each walk stops at the first
+        record already collected, so every record is visited once.
+
+        @:parameter record_ids iterable<int>
+        @:returns set<int>
+        """
+        closure = set()
+        for record_id in record_ids:
+            while record_id is not None and record_id not in closure:
+                record = self._records.get(record_id)
+                if record is None:
+                    break
+                closure.add(record_id)
+                record_id = record.parent_id
+        return closure
+
+    def update(self, record_id, parent_id, name, extra=()):
+        """ Adds or replaces a record, keeping children links up to date
+
+        A record linked to a parent not added yet is only linked by
+        `link_children`, once all records are added.
+
+        @:returns (<NodeRecord>, <int>) (The record and its former parent id)
+        """
+        old_record = self._records.get(record_id)
+        old_parent_id = old_record.parent_id if old_record else None
+        record = self.add(record_id, parent_id, name, extra)
+        if old_record is not None:
+            record.children = old_record.children
+            record.to_keep = old_record.to_keep
+            if old_parent_id != parent_id:
+                old_parent = self._records.get(old_parent_id)
+                if old_parent is not None:
+                    old_parent.children.discard(record_id)
+        parent = self._records.get(parent_id)
+        if parent is not None:
+            if parent.children is NO_CHILDREN:
+                parent.children = set()
+            parent.children.add(record_id)
+        return record, old_parent_id
+
+    def discard(self, record_id):
+        """ Removes a record and unlinks it from its parent """
+        record = self._records.pop(record_id, None)
+        if record is None:
+            return None
+        parent = self._records.get(record.parent_id)
+        if parent is not None and record_id in parent.children:
+            parent.children.discard(record_id)
+        return record
+
+    def save(self, filename, **metadata):
+        """ Writes records, with their `to_keep` flag, and `metadata` as JSON """
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename + ".tmp", "w") as stream:
+            json.dump({
+                "columns": self.columns,
+                "metadata": metadata,
+                "records": [
+                    [r.id, r.parent_id, r.name, r.extra, r.to_keep]
+                    for r in self._records.values()
+                ],
+            }, stream)
+        os.replace(filename + ".tmp", filename)
+
+    @classmethod
+    def load(cls, filename):
+        """ Reads a store written by `save`
+
+        @:returns (<NodeStore>, <dict>) (The store and its metadata)
+        """
+        with open(filename) as stream:
+            content = json.load(stream)
+        store = cls(content["columns"])
+        for record_id, parent_id, name, extra, to_keep in content["records"]:
+            store.add(record_id, parent_id, name, extra).to_keep = to_keep
+        store.link_children()
+        return store, content["metadata"]
+
+    def __getitem__(self, record_id):
+        try:
+            return self._records[int(record_id)]
+        except ValueError:
+            raise KeyError(record_id)
+
+    def __contains__(self, record_id):
+        try:
+            return int(record_id) in self._records
+        except (TypeError, ValueError):
+            return False
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
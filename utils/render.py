@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+import hashlib
+import os
+from collections import deque
+from shutil import copyfile
+
+import pygraphviz
+
+RENDER_CACHE_FOLDER = os.path.expanduser("~/.cache/camptocamp/render")
+# Above this number of nodes, `dot` layouts take minutes
+SFDP_THRESHOLD = 1500
+FINGERPRINT_ATTRIBUTES = ("fillcolor", "color", "group", "label")
+
+
+def graph_fingerprint(
+        graph,
+        attributes=FINGERPRINT_ATTRIBUTES,
+        nodes=None,
+        node_attributes=(),
+        successors=None,
+):
+    """ Returns a stable hash of nodes, edges and selected node attributes
+
+    @:parameter graph <pygraphviz.AGraph>
+    @:parameter attributes list<string> (Graphviz node attributes)
+    @:parameter nodes dict<string, dict> (Node store, when `node_attributes`
+        are read from it)
+    @:parameter node_attributes list<string> (Node store attributes)
+    @:parameter successors dict<string, list<string>> (Declared children,
+        which graph edges do not show once transitively reduced)
+    @:returns <string>
+    """
+    fingerprint = hashlib.sha1()
+    for node in sorted(graph.iternodes()):
+        fingerprint.update(node.encode("utf-8"))
+        for attribute in attributes:
+            fingerprint.update(b"\x1f" + (node.attr.get(attribute) or "").encode("utf-8"))
+        if node_attributes:
+            values = nodes.get(str(node)) or {}
+            for attribute in node_attributes:
+                fingerprint.update(b"\x1f" + repr(values.get(attribute)).encode("utf-8"))
+        fingerprint.update(b"\x1e")
+    for source, target in sorted(graph.iteredges()):
+        fingerprint.update("{}\x1f{}\x1e".format(source, target).encode("utf-8"))
+    if successors is not None:
+        fingerprint.update(b"\x1d")
+        for node, targets in sorted(successors.items()):
+            fingerprint.update("{}\x1f{}\x1e".format(node, "\x1f".join(sorted(targets))).encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+def render_fingerprint(graph):
+    """ Returns a hash of everything drawn: graph, node and edge attributes
+
+    @:parameter graph <pygraphviz.AGraph>
+    @:returns <string>
+    """
+    fingerprint = hashlib.sha1()
+    for key, value in sorted(graph.graph_attr.items()):
+        fingerprint.update("{}={}\x1f".format(key, value).encode("utf-8"))
+    fingerprint.update(b"\x1d")
+    for node in sorted(graph.iternodes()):
+        fingerprint.update(node.encode("utf-8"))
+        for key, value in sorted(node.attr.items()):
+            fingerprint.update("\x1f{}={}".format(key, value).encode("utf-8"))
+        fingerprint.update(b"\x1e")
+    fingerprint.update(b"\x1d")
+    for edge in sorted(graph.iteredges()):
+        fingerprint.update("{}\x1f{}".format(*edge).encode("utf-8"))
+        for key, value in sorted(edge.attr.items()):
+            fingerprint.update("\x1f{}={}".format(key, value).encode("utf-8"))
+        fingerprint.update(b"\x1e")
+    return fingerprint.hexdigest()
+
+
+def new_graph():
+    return pygraphviz.AGraph(
+        strict=True,
+        directed=True,
+        pad="4",
+        rankdir="LR",
+        ranksep="4",
+        overlap=False,
+        splines="true"
+    )
+
+
+def collapse(graph, cluster_of):
+    """ Returns a graph with one node per cluster
+
+    Edges inside a cluster are dropped, edges between clusters are merged
+    and labelled with the number of edges they replace.
+
+    @:parameter graph <pygraphviz.AGraph>
+    @:parameter cluster_of <callable> (node name -> cluster name)
+    @:returns <pygraphviz.AGraph>
+    """
+    clusters = {}
+    for node in graph.iternodes():
+        clusters.setdefault(cluster_of(str(node)) or "-", []).append(node)
+    edges = {}
+    for source, target in graph.iteredges():
+        edge = (cluster_of(str(source)) or "-", cluster_of(str(target)) or "-")
+        if edge[0] != edge[1]:
+            edges[edge] = edges.get(edge, 0) + 1
+    collapsed = new_graph()
+    for name, nodes in clusters.items():
+        collapsed.add_node(name, label="{} ({})".format(name, len(nodes)))
+    for (source, target), count in edges.items():
+        collapsed.add_edge(source, target, label=str(count))
+    return collapsed
+
+
+def neighborhood(graph, name, hops=1):
+    """ Returns the subgraph of nodes at most `hops` edges away from `name`
+
+    @:parameter graph <pygraphviz.AGraph>
+    @:parameter name <string> (A node name)
+    @:parameter hops <int>
+    @:returns <pygraphviz.AGraph>
+    """
+    successors = {}
+    predecessors = {}
+    for source, target in graph.iteredges():
+        successors.setdefault(source, []).append(target)
+        predecessors.setdefault(target, []).append(source)
+    nodes = {name}
+    queue = deque([(name, 0)])
+    while queue:
+        node, distance = queue.popleft()
+        if distance == hops:
+            continue
+        for next_node in successors.get(node, []) + predecessors.get(node, []):
+            if next_node not in nodes:
+                nodes.add(next_node)
+                queue.append((next_node, distance + 1))
+    # A standalone graph: `graph.subgraph()` would stay attached to `graph`
+    subgraph = new_graph()
+    for node in nodes:
+        subgraph.add_node(node, **graph.get_node(node).attr)
+    for source, target in graph.iteredges():
+        if source in nodes and target in nodes:
+            subgraph.add_edge(source, target, **graph.get_edge(source, target).attr)
+    return subgraph
+
+
+def render(
+        graph,
+        filename,
+        prog=None,
+        args="",
+        sfdp_threshold=SFDP_THRESHOLD,
+        cache_folder=RENDER_CACHE_FOLDER,
+):
+    """ Draw a graph, reusing a previous rendering of the same graph
+
+    Renderings are cached by graph, node and edge attributes (see
+    `render_fingerprint`), layout program, arguments and output format. `dot` is used unless the graph has more than
+    `sfdp_threshold` nodes.
+
+    @:parameter graph <pygraphviz.AGraph>
+    @:parameter filename <string>
+    @:returns <string> (The layout program used)
+    """
+    if prog is None:
+        prog = "sfdp" if graph.number_of_nodes() > sfdp_threshold else "dot"
+    extension = os.path.splitext(filename)[1]
+    key = hashlib.sha1("\x1f".join([
+        render_fingerprint(graph), prog, args, extension
+    ]).encode("utf-8")).hexdigest()
+    cached_file = os.path.join(cache_folder, key + extension)
+    if not os.path.isfile(cached_file):
+        os.makedirs(cache_folder, exist_ok=True)
+        # Draw aside then rename, so an interrupted draw is never cached
+        graph.draw(cached_file + ".tmp", format=extension.lstrip("."), prog=prog, args=args)
+        os.replace(cached_file + ".tmp", cached_file)
+    copyfile(cached_file, filename)
+    return prog
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Attributes of a spec element which are not used to locate its target
+SPEC_ATTRIBUTES = ("position", "version")
+POSITIONS = ("inside", "after", "before", "replace", "attributes")
+
+
+def _hasclass(context, *classes):
+    """ Odoo `hasclass()` XPath function: the context node has all `classes` """
+    node_classes = set(context.context_node.attrib.get("class", "").split())
+    return node_classes.issuperset(classes)
+
+
+def register_xpath_functions():
+    """ Registers the XPath extension functions Odoo views may use """
+    from lxml import etree
+
+    functions = etree.FunctionNamespace(None)
+    if "hasclass" not in functions:
+        functions["hasclass"] = _hasclass
+
+
+def parse_arch(arch):
+    """ Parses a view architecture as stored in `arch_db`
+
+    Since Odoo 16 `arch_db` is a translated jsonb column: the english
+    value is used, or the first one.
+
+    @:parameter arch <string>
+    @:returns <lxml.etree._Element>
+    """
+    from lxml import etree
+
+    arch = arch.strip()
+    if arch.startswith("{"):
+        values = json.loads(arch)
+        arch = values.get("en_US") or next(iter(values.values()), "")
+    return etree.fromstring(arch.encode("utf-8"))
+
+
+def locate(source, spec):
+    """ Returns the node targeted by an inheritance spec, or None
+
+    @:parameter source <lxml.etree._Element> (Architecture to modify)
+    @:parameter spec <lxml.etree._Element> (An xpath or a node to match)
+    @:returns <lxml.etree._Element>
+    """
+    from lxml import etree
+
+    if spec.tag == "xpath":
+        register_xpath_functions()
+        try:
+            nodes = source.xpath(spec.get("expr"))
+        except etree.XPathError:
+            return None
+        return nodes[0] if nodes and isinstance(nodes[0], etree._Element) else None
+    attributes = {
+        key: value for key, value in spec.attrib.items()
+        if key not in SPEC_ATTRIBUTES
+    }
+    for node in source.iter(spec.tag):
+        if all(node.get(key) == value for key, value in attributes.items()):
+            return node
+    return None
+
+
+def spec_label(spec):
+    if spec.tag == "xpath":
+        return "xpath {}".format(spec.get("expr"))
+    return "<{} {}>".format(spec.tag, " ".join(
+        '{}="{}"'.format(key, value) for key, value in spec.attrib.items()
+        if key not in SPEC_ATTRIBUTES
+    ))
+
+
+def attribute_value(value, spec):
+    """ Returns the new value of an attribute modified by an `<attribute>` spec
+
+    Like Odoo, `add` and `remove` edit a list of values split on `separator`
+    (a comma by default, any whitespace for a space), otherwise the value is
+    replaced by the spec text. An empty result removes the attribute.
+
+    @:parameter value <string> (Current value, or None)
+    @:parameter spec <lxml.etree._Element> (An `<attribute>` element)
+    @:returns <string>
+    """
+    if not spec.get("add") and not spec.get("remove"):
+        return spec.text or ""
+    separator = spec.get("separator", ",")
+    if separator == " ":
+        separator = None
+    to_add = [s for s in (s.strip() for s in spec.get("add", "").split(separator)) if s]
+    to_remove = {s.strip() for s in spec.get("remove", "").split(separator)}
+    values = (s.strip() for s in (value or "").split(separator))
+    return (separator or " ").join(
+        [v for v in values if v not in to_remove] + to_add
+    )
+
+
+def apply_specs(source, arch):
+    """ Applies the inheritance specs of an extension view on `source`
+
+    Like Odoo, specs are the children of a `<data>` root or the root itself,
+    and are applied in order. Only target resolution is checked, not the
+    validity of the resulting view.
+
+    @:parameter source <lxml.etree._Element> (Modified in place)
+    @:parameter arch <lxml.etree._Element> (Extension view architecture)
+    @:returns list<string> (Specs which did not resolve)
+    """
+    specs = list(arch) if arch.tag == "data" else [arch]
+    errors = []
+    for spec in specs:
+        if not isinstance(spec.tag, str):
+            # Comments and processing instructions
+            continue
+        if spec.tag == "data":
+            errors.extend(apply_specs(source, spec))
+            continue
+        node = locate(source, spec)
+        position = spec.get("position", "inside")
+        if node is None:
+            errors.append("{} cannot be located".format(spec_label(spec)))
+            continue
+        if position not in POSITIONS:
+            errors.append("{} has an invalid position '{}'".format(spec_label(spec), position))
+            continue
+        children = []
+        for child in spec:
+            if child.get("position") == "move":
+                # Existing node moved next to or inside the target
+                moved = locate(source, child)
+                if moved is None:
+                    errors.append("{} cannot be moved".format(spec_label(child)))
+                    continue
+                child = moved
+            children.append(child)
+        if position == "replace":
+            parent = node.getparent()
+            if parent is None:
+                # The whole architecture is replaced
+                if children:
+                    node.clear()
+                    node.tag = children[0].tag
+                    node.attrib.update(children[0].attrib)
+                    node.extend(list(children[0]))
+                continue
+            for child in children:
+                node.addprevious(child)
+            parent.remove(node)
+        elif position == "attributes":
+            for child in spec.iterfind("attribute"):
+                name = child.get("name")
+                value = attribute_value(node.get(name), child)
+                if value:
+                    node.set(name, value)
+                elif name in node.attrib:
+                    del node.attrib[name]
+        elif position == "inside":
+            node.extend(children)
+        elif position == "after":
+            for child in reversed(children):
+                node.addnext(child)
+        elif position == "before":
+            for child in children:
+                node.addprevious(child)
+    return errors
+
+
+def validate_tree(views, root_id):
+    """ Applies every inheritance chain starting from a root view
+
+    Like Odoo, extension views are applied by priority then id, each one
+    followed by its own extensions. Primary views start again from a copy
+    of the fully combined architecture they inherit from.
+
+    @:parameter views dict<int, (int, string, int, string)>
+        (id -> parent id, mode, priority, arch) of the root and its descendants
+    @:parameter root_id <int>
+    @:returns list<dict> (Unresolved specs: root, view and error)
+    """
+    import copy
+
+    children = {}
+    for record_id, (parent_id, mode, priority, arch) in views.items():
+        children.setdefault(parent_id, []).append((priority, record_id))
+    errors = []
+
+    def report(record_id, message):
+        errors.append({"root_id": root_id, "view_id": record_id, "error": message})
+
+    def parse(record_id):
+        try:
+            return parse_arch(views[record_id][3])
+        except Exception as e:
+            report(record_id, "invalid architecture: {}".format(e))
+            return None
+
+    def apply_extensions(view_id, source):
+        """ Applies extensions of `view_id` on `source`, returns primary
+        views met on the way """
+        primaries = []
+        # (view id, index of its next child to apply)
+        stack = [(view_id, 0)]
+        while stack:
+            current_id, index = stack.pop()
+            current_children = sorted(children.get(current_id, []))
+            if index == len(current_children):
+                continue
+            stack.append((current_id, index + 1))
+            child_id = current_children[index][1]
+            if views[child_id][1] == "primary":
+                primaries.append(child_id)
+                continue
+            arch = parse(child_id)
+            if arch is None:
+                continue
+            for message in apply_specs(source, arch):
+                report(child_id, message)
+            stack.append((child_id, 0))
+        return primaries
+
+    root = parse(root_id)
+    if root is None:
+        return errors
+    queue = [(root_id, root)]
+    for view_id, source in queue:
+        for primary_id in apply_extensions(view_id, source):
+            arch = parse(primary_id)
+            if arch is None:
+                continue
+            primary_source = copy.deepcopy(source)
+            for message in apply_specs(primary_source, arch):
+                report(primary_id, message)
+            queue.append((primary_id, primary_source))
+    return errors
+
+
+def _validate_tree(job):
+    return validate_tree(*job)
+
+
+def validate_views(views, max_workers=None):
+    """ Validates every view tree, one root per task in a process pool
+
+    @:parameter views dict<int, (int, string, int, string)>
+        (id -> parent id, mode, priority, arch)
+    @:parameter max_workers <int> (Defaults to the number of CPUs)
+    @:returns list<dict> (see `validate_tree`)
+    """
+    children = {}
+    for record_id, (parent_id, mode, priority, arch) in views.items():
+        if parent_id in views:
+            children.setdefault(parent_id, []).append(record_id)
+    jobs = []
+    for root_id, values in views.items():
+        if values[0] in views:
+            continue
+        tree = {root_id: values}
+        stack = [root_id]
+        while stack:
+            for child_id in children.get(stack.pop(), []):
+                tree[child_id] = views[child_id]
+                stack.append(child_id)
+        # A single view has nothing to apply
+        if len(tree) > 1:
+            jobs.append((tree, root_id))
+    # Biggest trees first, so they do not end the run alone
+    jobs.sort(key=lambda job: -len(job[0]))
+    errors = []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        for tree_errors in executor.map(_validate_tree, jobs):
+            errors.extend(tree_errors)
+    return errors